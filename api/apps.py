@@ -10,3 +10,5 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import api.signals
+        from plugins.interfaces import load_catalogs
+        load_catalogs()
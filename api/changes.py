@@ -0,0 +1,88 @@
+"""Append-only log of external block list changes."""
+from itertools import islice
+
+from django.db import connection
+
+from api.models import EBL_METHOD, EblChange, Target, TargetIpRange
+from api.streaming import CHUNK_SIZE
+from api.utils import (
+    int_to_ipaddr, ip_target_bounds, merge_ip_ranges, subtract_ip_ranges)
+
+EBL_TYPES = (Target.IPADDR, Target.DOMAIN, Target.URL)
+
+# arbitrary key of the advisory lock serializing writes to the change log
+EBL_CHANGE_LOCK = 0x45424c
+
+
+def on_ebl(instance):
+    """Check if a Target is published on its external block list."""
+    return (instance.target_type in EBL_TYPES and
+            instance.target_action == Target.BAN and
+            instance.method == EBL_METHOD)
+
+
+def ip_range_entry(first, last):
+    """Get the entry logged for a range of IP addresses."""
+    if first == last:
+        return int_to_ipaddr(first)
+    return '%s-%s' % (int_to_ipaddr(first), int_to_ipaddr(last))
+
+
+def lock_changes():
+    """Hold the change log lock until the current transaction ends."""
+    # changes are numbered in commit order, so a cursor never skips a
+    # change committed after it was handed out
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [EBL_CHANGE_LOCK])
+
+
+def uncovered_entries(instance):
+    """Iterate over the entries of a Target not on the EBL without it."""
+    if instance.target_type != Target.IPADDR:
+        if Target.objects.filter(
+                target=instance.target,
+                target_type=instance.target_type,
+                target_action=Target.BAN,
+                method=EBL_METHOD,
+        ).exclude(id=instance.id).exists():
+            return iter([])
+        return iter([instance.target])
+    first, last = ip_target_bounds(instance.target)
+    ranges = merge_ip_ranges(TargetIpRange.objects.filter(
+        ipaddr_action=Target.BAN,
+        method=EBL_METHOD,
+    ).overlapping(first, last).exclude(target_id=instance.id).order_by(
+        'first_ipaddr').values_list('first_ipaddr', 'last_ipaddr'))
+    # one entry per uncovered range, expanded to addresses when read
+    return (
+        ip_range_entry(gap_first, gap_last)
+        for gap_first, gap_last in subtract_ip_ranges(first, last, ranges)
+    )
+
+
+def record_changes(instance, change):
+    """Record the EBL entries a Target adds or removes."""
+    if not on_ebl(instance):
+        return
+    lock_changes()
+    entries = uncovered_entries(instance)
+    while True:
+        # a fragmented IP range can add many entries, so only hold a chunk
+        changes = [
+            EblChange(
+                change=change, target_type=instance.target_type, entry=entry)
+            for entry in islice(entries, CHUNK_SIZE)
+        ]
+        if not changes:
+            return
+        EblChange.objects.bulk_create(changes)
+
+
+def record_addition(instance):
+    """Record the EBL entries added by a new Target."""
+    record_changes(instance, EblChange.ADD)
+
+
+def record_removal(instance):
+    """Record the EBL entries removed by a deleted Target."""
+    record_changes(instance, EblChange.REMOVE)
@@ -0,0 +1,40 @@
+"""Maintained counts of Targets by type and action."""
+from django.core.exceptions import ValidationError
+from django.db.models import F
+
+from api.models import Target, TargetCount
+
+# IP, Domain, and URL blocks are limited to 10K entries
+BAN_LIMIT = 10000
+LIMITED_TYPES = {Target.IPADDR, Target.DOMAIN, Target.URL}
+
+
+def get_limit(target_type, target_action):
+    """Get the maximum number of Targets of a type and action, if any."""
+    if target_action == Target.BAN and target_type in LIMITED_TYPES:
+        return BAN_LIMIT
+    return None
+
+
+def add_to_count(target_type, target_action, amount):
+    """Add to the count of Targets, raising if it would exceed the limit."""
+    counts = TargetCount.objects.filter(
+        target_type=target_type, target_action=target_action)
+    limit = get_limit(target_type, target_action)
+    if limit is not None and amount > 0:
+        # check and update the count in a single statement
+        counts = counts.filter(count__lte=limit - amount)
+    if counts.update(count=F('count') + amount):
+        return
+    _, created = TargetCount.objects.get_or_create(
+        target_type=target_type,
+        target_action=target_action,
+        defaults={'count': Target.objects.filter(
+            target_type=target_type, target_action=target_action).count()},
+    )
+    if created:
+        # the counter did not exist yet, so try again now that it does
+        add_to_count(target_type, target_action, amount)
+        return
+    raise ValidationError(
+        {'target': 'Exceeded %s %s instances.' % (limit, target_action)})
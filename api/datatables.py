@@ -0,0 +1,75 @@
+"""DataTables server-side processing helpers."""
+from django.db.models import Q
+
+from api.pagination import MAX_LIMIT
+
+# columns the ban list is allowed to order by
+ORDERABLE_COLUMNS = (
+    'target',
+    'target_action',
+    'target_type',
+    'method',
+    'reason',
+    'user',
+    'date_created',
+)
+
+# columns searched by the DataTables search box
+SEARCHABLE_COLUMNS = (
+    'target',
+    'target_action',
+    'target_type',
+    'method',
+    'reason',
+    'user',
+)
+
+
+def get_int_param(params, name, default):
+    """Get a non-negative integer parameter from a DataTables request."""
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value >= 0 else default
+
+
+def search_targets(queryset, params):
+    """Filter Targets by the DataTables global search value."""
+    value = params.get('search[value]', '').strip()
+    if not value:
+        return queryset
+    query = Q()
+    for column in SEARCHABLE_COLUMNS:
+        query |= Q(**{'%s__icontains' % column: value})
+    return queryset.filter(query)
+
+
+def order_targets(queryset, params):
+    """Order Targets by the DataTables order parameters."""
+    ordering = []
+    index = 0
+    while 'order[%s][column]' % index in params:
+        column = params.get(
+            'columns[%s][data]' % params.get('order[%s][column]' % index))
+        if column in ORDERABLE_COLUMNS:
+            direction = params.get('order[%s][dir]' % index)
+            ordering.append(
+                '-%s' % column if direction == 'desc' else column)
+        index += 1
+    # id keeps the order stable between draws
+    ordering.append('-id')
+    return queryset.order_by(*ordering)
+
+
+def page_targets(queryset, params):
+    """Slice one page of Targets from the DataTables paging parameters."""
+    start = get_int_param(params, 'start', 0)
+    try:
+        length = int(params.get('length', 10))
+    except (TypeError, ValueError):
+        length = 10
+    # a length of -1 asks for all rows, which is capped like the API
+    if length < 1 or length > MAX_LIMIT:
+        length = MAX_LIMIT
+    return queryset[start:start + length]
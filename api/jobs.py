@@ -0,0 +1,214 @@
+"""Queue of plugin methods run by workers outside of requests."""
+from datetime import timedelta
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from api.models import PluginJob, Target
+from plugins.interfaces import TargetInterface, get_method_weights
+
+# get api logger
+LOGGER = logging.getLogger(__name__)
+
+# seconds between heartbeats of a running job, and without one before
+# the job is considered abandoned by its worker and retried
+HEARTBEAT_INTERVAL = 30
+HEARTBEAT_TIMEOUT = 120
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 1
+# methods of one weight run at once when fanned out from a request
+FANOUT_WORKERS = 4
+
+
+def needs_job(target_action, method):
+    """Check if a Target has a plugin method to run."""
+    return target_action == Target.BAN and method.lower() != 'none'
+
+
+def enqueue_jobs(instances, status=PluginJob.PENDING):
+    """Queue the plugin method of each Target to be run by a worker."""
+    # jobs queued as running are run by the caller, and only picked up by
+    # workers if the caller dies before finishing them
+    attempts = 1 if status == PluginJob.RUNNING else 0
+    return PluginJob.objects.bulk_create([
+        PluginJob(
+            target=instance,
+            method=instance.method,
+            status=status,
+            attempts=attempts,
+        )
+        for instance in instances
+        if needs_job(instance.target_action, instance.method)
+    ])
+
+
+def fail_abandoned_jobs():
+    """Mark jobs abandoned by their workers too many times as failed."""
+    expired = timezone.now() - timedelta(seconds=HEARTBEAT_TIMEOUT)
+    return PluginJob.objects.filter(
+        status=PluginJob.RUNNING,
+        attempts__gte=MAX_ATTEMPTS,
+        last_modified__lt=expired,
+    ).update(
+        status=PluginJob.FAILED,
+        errors=json.dumps({'job': [
+            'Abandoned by its worker after %s attempts.' % MAX_ATTEMPTS]}),
+        last_modified=timezone.now(),
+    )
+
+
+def claim_job():
+    """Mark the oldest runnable job as running and return it, if any."""
+    fail_abandoned_jobs()
+    # SKIP LOCKED lets many workers claim jobs without waiting on each other
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {table} SET status = %s, attempts = attempts + 1, '
+            'last_modified = now() WHERE id = ('
+            'SELECT id FROM {table} WHERE status = %s OR ('
+            'status = %s AND attempts < %s AND '
+            "last_modified < now() - %s * interval '1 second') "
+            'ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING id'.format(
+                table=connection.ops.quote_name(PluginJob._meta.db_table)),
+            [PluginJob.RUNNING, PluginJob.PENDING, PluginJob.RUNNING,
+             MAX_ATTEMPTS, HEARTBEAT_TIMEOUT])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return PluginJob.objects.select_related('target').get(id=row[0])
+
+
+def owned_jobs(jobs):
+    """Get the jobs still running on the attempt that started them."""
+    if not jobs:
+        return PluginJob.objects.none()
+    query = Q()
+    for job in jobs:
+        query |= Q(id=job.id, attempts=job.attempts)
+    return PluginJob.objects.filter(query, status=PluginJob.RUNNING)
+
+
+def heartbeat(jobs, done):
+    """Touch running jobs until they are done, so they are not retried."""
+    try:
+        while not done.wait(HEARTBEAT_INTERVAL):
+            owned_jobs(jobs).update(last_modified=timezone.now())
+    finally:
+        connection.close()
+
+
+def start_heartbeat(jobs):
+    """Send heartbeats for jobs in a thread, until the event is set."""
+    done = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(jobs, done))
+    beat.daemon = True
+    beat.start()
+    return done, beat
+
+
+def run_job(job):
+    """Run the plugin method of a job and record the result."""
+    # plugin methods are not all idempotent (e.g. moving an AD user), so a
+    # job is only retried once its worker stops sending heartbeats, and is
+    # skipped by a worker that missed them and lost it to a retry
+    if not owned_jobs([job]).update(last_modified=timezone.now()):
+        LOGGER.warning('job="%s" skipped, taken over by a retry', job.id)
+        return job
+    done, beat = start_heartbeat([job])
+    target = TargetInterface(
+        job.target.target,
+        job.target.target_type,
+        job.target.reason,
+    )
+    try:
+        target.run_method(job.method)
+    except serializers.ValidationError as err:
+        job.status = PluginJob.FAILED
+        job.errors = json.dumps(err.detail)
+        LOGGER.warning(
+            'job="%s" target="%s" method="%s" errors="%s"',
+            job.id, job.target.target, job.method, job.errors)
+    except Exception:
+        # keep the worker alive when a method name cannot even be parsed
+        job.status = PluginJob.FAILED
+        job.errors = json.dumps(
+            {'plugin': ['Unhandled exception in plugin method.']})
+        LOGGER.exception(
+            'job="%s" target="%s" method="%s"',
+            job.id, job.target.target, job.method)
+    else:
+        job.status = PluginJob.SUCCEEDED
+        job.errors = ''
+    finally:
+        done.set()
+        beat.join()
+    job.last_modified = timezone.now()
+    if not owned_jobs([job]).update(
+            status=job.status, errors=job.errors,
+            last_modified=job.last_modified):
+        LOGGER.warning('job="%s" result dropped, taken over by a retry',
+                       job.id)
+    return job
+
+
+def run_pooled_job(job):
+    """Run a job in a pool thread, closing the connection it opened."""
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+def run_jobs_by_weight(jobs):
+    """Run jobs concurrently, one weight at a time, highest weight first."""
+    weights = get_method_weights()
+    groups = {}
+    for job in jobs:
+        groups.setdefault(weights.get(job.method, 0), []).append(job)
+    if not groups:
+        return jobs
+    # jobs of lower weights wait as running, so keep them all alive until
+    # the last group is done
+    done, beat = start_heartbeat(jobs)
+    pool = ThreadPool(min(FANOUT_WORKERS, max(map(len, groups.values()))))
+    try:
+        for weight in sorted(groups, reverse=True):
+            pool.map(run_pooled_job, groups[weight])
+    finally:
+        pool.close()
+        pool.join()
+        done.set()
+        beat.join()
+    return jobs
+
+
+def work(stop):
+    """Run queued jobs until the stop event is set."""
+    try:
+        while not stop.is_set():
+            job = claim_job()
+            if job is None:
+                stop.wait(POLL_INTERVAL)
+                continue
+            run_job(job)
+    finally:
+        connection.close()
+
+
+def start_workers(count):
+    """Start worker threads, returning them and the event to stop them."""
+    stop = threading.Event()
+    workers = [
+        threading.Thread(target=work, args=(stop,), name='job-worker-%s' % i)
+        for i in range(count)
+    ]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    return workers, stop
@@ -0,0 +1,29 @@
+"""Run queued plugin jobs."""
+from django.core.management.base import BaseCommand
+
+from api.jobs import start_workers
+from ebl.snapshots import start_refresher
+
+
+class Command(BaseCommand):
+    """Run queued plugin jobs until interrupted."""
+    help = ('Run queued plugin jobs with a pool of worker threads, and '
+            'regenerate changed EBL snapshots.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Number of jobs to run at once.')
+
+    def handle(self, *args, **options):
+        workers, stop = start_workers(options['workers'])
+        workers.append(start_refresher(stop))
+        try:
+            # join with a timeout, so the main thread still gets interrupts
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(1)
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
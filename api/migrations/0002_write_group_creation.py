@@ -9,6 +9,8 @@ from api.models import Target
 
 def create_groups_and_permissions(apps, schema_editor):
     """Create groups defined in config and add permissions to groups."""
+    # permissions are only created after all migrations, unless asked now
+    emit_post_migrate_signal(0, False, schema_editor.connection.alias)
     # Create Groups with Permissions
     # all access
     target_all_read = Permission.objects.get(codename='target_all_read')
@@ -68,6 +70,8 @@ class Migration(migrations.Migration):
 
     dependencies = [
         ('api', '0001_initial'),
+        ('auth', '0008_alter_user_username_max_length'),
+        ('contenttypes', '0002_remove_content_type_name'),
     ]
 
     operations = [
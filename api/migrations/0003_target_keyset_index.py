@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 17:31
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_write_group_creation'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='target',
+            index_together=set([('date_created', 'id')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-17 17:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_target_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='targetipaddr',
+            name='ipaddr_action',
+            field=models.CharField(choices=[('ban', 'Ban'), ('allow', 'Allow')], db_index=True, max_length=5),
+        ),
+        migrations.AlterIndexTogether(
+            name='target',
+            index_together=set([('date_created', 'id'), ('target_type', 'target_action'), ('target', 'target_type', 'target_action')]),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import netaddr
+
+from api.utils import int_to_ipaddr, merge_ip_ranges
+
+
+def ranges_from_ipaddrs(apps, schema_editor):
+    """Collapse the TargetIpAddr entries of each IP Target into ranges."""
+    Target = apps.get_model('api', 'Target')
+    TargetIpAddr = apps.get_model('api', 'TargetIpAddr')
+    TargetIpRange = apps.get_model('api', 'TargetIpRange')
+    through = TargetIpAddr.target.through
+    for target in Target.objects.filter(target_type='ip').iterator():
+        ipaddrs = sorted(
+            netaddr.IPAddress(ipaddr).value
+            for ipaddr in through.objects.filter(target=target).values_list(
+                'targetipaddr__ipaddr', flat=True))
+        TargetIpRange.objects.bulk_create([
+            TargetIpRange(
+                first_ipaddr=first,
+                last_ipaddr=last,
+                ipaddr_action=target.target_action,
+                target=target,
+                method=target.method,
+            )
+            for first, last in merge_ip_ranges(
+                (ipaddr, ipaddr) for ipaddr in ipaddrs)
+        ])
+
+
+def ipaddrs_from_ranges(apps, schema_editor):
+    """Expand each TargetIpRange back into TargetIpAddr entries."""
+    TargetIpAddr = apps.get_model('api', 'TargetIpAddr')
+    TargetIpRange = apps.get_model('api', 'TargetIpRange')
+    for ip_range in TargetIpRange.objects.select_related('target').iterator():
+        for ipaddr in xrange(ip_range.first_ipaddr, ip_range.last_ipaddr + 1):
+            ip_entry, _ = TargetIpAddr.objects.get_or_create(
+                ipaddr=int_to_ipaddr(ipaddr),
+                defaults={
+                    'ipaddr_action': ip_range.ipaddr_action,
+                    'method': ip_range.method,
+                },
+            )
+            ip_entry.target.add(ip_range.target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_target_read_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetIpRange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_ipaddr', models.BigIntegerField()),
+                ('last_ipaddr', models.BigIntegerField()),
+                ('ipaddr_action', models.CharField(choices=[('ban', 'Ban'), ('allow', 'Allow')], max_length=5)),
+                ('method', models.CharField(max_length=50)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Target')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='targetiprange',
+            index_together=set([('ipaddr_action', 'first_ipaddr', 'last_ipaddr')]),
+        ),
+        migrations.RunPython(ranges_from_ipaddrs, ipaddrs_from_ranges),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_targetiprange'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='targetipaddr',
+            name='target',
+        ),
+        migrations.DeleteModel(
+            name='TargetIpAddr',
+        ),
+    ]
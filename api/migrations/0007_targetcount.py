@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_targets(apps, schema_editor):
+    """Seed a count for every type and action from the existing Targets."""
+    Target = apps.get_model('api', 'Target')
+    TargetCount = apps.get_model('api', 'TargetCount')
+    counts = {
+        (row['target_type'], row['target_action']): row['count']
+        for row in Target.objects.values(
+            'target_type', 'target_action').annotate(count=Count('id'))
+    }
+    TargetCount.objects.bulk_create([
+        TargetCount(
+            target_type=target_type,
+            target_action=target_action,
+            count=counts.get((target_type, target_action), 0),
+        )
+        for target_type, _ in Target._meta.get_field('target_type').choices
+        for target_action, _ in Target._meta.get_field(
+            'target_action').choices
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_delete_targetipaddr'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('ip', 'IP Address'), ('domain', 'Domain'), ('url', 'URL'), ('hash', 'Hash'), ('user', 'User')], max_length=6)),
+                ('target_action', models.CharField(choices=[('ban', 'Ban'), ('allow', 'Allow')], max_length=5)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='targetcount',
+            unique_together=set([('target_type', 'target_action')]),
+        ),
+        migrations.RunPython(count_targets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_targetcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EblChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('change', models.CharField(choices=[('add', 'Add'), ('remove', 'Remove')], max_length=6)),
+                ('target_type', models.CharField(choices=[('ip', 'IP Address'), ('domain', 'Domain'), ('url', 'URL'), ('hash', 'Hash'), ('user', 'User')], max_length=6)),
+                ('entry', models.CharField(max_length=900)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='eblchange',
+            index_together=set([('target_type', 'id')]),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_eblchange'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='target',
+            index_together=set([('date_created', 'id'), ('target_type', 'target_action'), ('target', 'target_type', 'target_action'), ('target_type', 'target_action', 'method', 'target')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='targetiprange',
+            index_together=set([('ipaddr_action', 'first_ipaddr', 'last_ipaddr'), ('ipaddr_action', 'method', 'first_ipaddr', 'last_ipaddr')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_ebl_method_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PluginJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=9)),
+                ('method', models.CharField(max_length=50)),
+                ('errors', models.TextField(blank=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Target')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='pluginjob',
+            index_together=set([('status', 'id')]),
+        ),
+    ]
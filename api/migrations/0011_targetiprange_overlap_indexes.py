@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# a btree can only bound one end of a range in an overlap test, so each
+# action gets a GiST index of its ranges, matched by the overlap lookups
+OVERLAP_INDEX = (
+    'CREATE INDEX api_targetiprange_{action}_overlap ON api_targetiprange '
+    "USING gist (int8range(first_ipaddr, last_ipaddr, '[]')) "
+    "WHERE ipaddr_action = '{action}'")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_pluginjob'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            OVERLAP_INDEX.format(action=action),
+            'DROP INDEX api_targetiprange_{action}_overlap'.format(
+                action=action),
+        )
+        for action in ('ban', 'allow')
+    ]
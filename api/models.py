@@ -3,6 +3,10 @@ from __future__ import unicode_literals
 
 from django.db import models
 from django.utils.encoding import python_2_unicode_compatible
+import netaddr
+
+# plugin method that publishes Targets on the external block lists
+EBL_METHOD = 'paloaltonetworks_add_to_ebl'
 
 
 @python_2_unicode_compatible
@@ -44,6 +48,12 @@ class Target(models.Model):
     last_modified = models.DateTimeField(auto_now=True)
 
     class Meta:
+        index_together = (
+            ('date_created', 'id'),
+            ('target_type', 'target_action'),
+            ('target', 'target_type', 'target_action'),
+            ('target_type', 'target_action', 'method', 'target'),
+        )
         permissions = (
             ('target_all_read', 'Read access for all Target types'),
             ('target_all_write', 'Write access for all Target types'),
@@ -64,15 +74,123 @@ class Target(models.Model):
 
 
 @python_2_unicode_compatible
-class TargetIpAddr(models.Model):
-    """Definition of an IP Address Target."""
-    ipaddr = models.CharField(max_length=45, unique=True)
+class TargetCount(models.Model):
+    """Number of Targets of a type and action."""
+    target_type = models.CharField(
+        max_length=6,
+        choices=Target.TARGET_TYPE_CHOICES,
+    )
+    target_action = models.CharField(
+        max_length=5,
+        choices=Target.TARGET_ACTION_CHOICES,
+    )
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            ('target_type', 'target_action'),
+        )
+
+    def __str__(self):
+        return '%s %s' % (self.target_type, self.target_action)
+
+
+class TargetIpRangeQuerySet(models.QuerySet):
+    """Queries of IP address ranges."""
+    def overlapping(self, first, last):
+        """Filter the ranges overlapping the range from first to last."""
+        # written to match the GiST index of each action, which bounds both
+        # ends of the range, unlike a btree on (first_ipaddr, last_ipaddr)
+        return self.extra(
+            where=["int8range(first_ipaddr, last_ipaddr, '[]') && "
+                   "int8range(%s, %s, '[]')"],
+            params=[first, last])
+
+
+@python_2_unicode_compatible
+class TargetIpRange(models.Model):
+    """Definition of an IP Address range Target."""
+    first_ipaddr = models.BigIntegerField()
+    last_ipaddr = models.BigIntegerField()
     ipaddr_action = models.CharField(
         max_length=5,
         choices=Target.TARGET_ACTION_CHOICES,
     )
-    target = models.ManyToManyField(Target)
+    target = models.ForeignKey(Target, on_delete=models.CASCADE)
     method = models.CharField(max_length=50)
 
+    objects = TargetIpRangeQuerySet.as_manager()
+
+    class Meta:
+        index_together = (
+            ('ipaddr_action', 'first_ipaddr', 'last_ipaddr'),
+            ('ipaddr_action', 'method', 'first_ipaddr', 'last_ipaddr'),
+        )
+
+    def __str__(self):
+        return '%s-%s' % (
+            netaddr.IPAddress(self.first_ipaddr),
+            netaddr.IPAddress(self.last_ipaddr))
+
+
+@python_2_unicode_compatible
+class EblChange(models.Model):
+    """Definition of an entry added to or removed from an EBL."""
+    ADD = 'add'
+    REMOVE = 'remove'
+    CHANGE_CHOICES = (
+        (ADD, 'Add'),
+        (REMOVE, 'Remove'),
+    )
+    change = models.CharField(
+        max_length=6,
+        choices=CHANGE_CHOICES,
+    )
+    target_type = models.CharField(
+        max_length=6,
+        choices=Target.TARGET_TYPE_CHOICES,
+    )
+    entry = models.CharField(max_length=900)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = (
+            ('target_type', 'id'),
+        )
+
+    def __str__(self):
+        return '%s %s' % (self.change, self.entry)
+
+
+@python_2_unicode_compatible
+class PluginJob(models.Model):
+    """Definition of a plugin method queued to run on a Target."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+    status = models.CharField(
+        max_length=9,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    target = models.ForeignKey(Target, on_delete=models.CASCADE)
+    method = models.CharField(max_length=50)
+    errors = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    date_created = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = (
+            ('status', 'id'),
+        )
+
     def __str__(self):
-        return self.ipaddr
+        return '%s %s' % (self.method, self.status)
@@ -0,0 +1,78 @@
+"""API pagination helpers."""
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def get_limit(value):
+    """Get page size from a query parameter, bounded by MAX_LIMIT."""
+    if value is None:
+        return DEFAULT_LIMIT
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('Limit must be a positive integer.')
+    return min(limit, MAX_LIMIT)
+
+
+def encode_cursor(target):
+    """Encode a cursor pointing just after the given Target."""
+    position = '%s,%s' % (target.date_created.isoformat(), target.id)
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into a (date_created, id) tuple."""
+    try:
+        position = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        date_created, target_id = position.decode('utf-8').rsplit(',', 1)
+        date_created = parse_datetime(date_created)
+        target_id = int(target_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor.')
+    if date_created is None:
+        raise ValueError('Invalid cursor.')
+    return date_created, target_id
+
+
+def order_by_keyset(queryset):
+    """Order Targets by the (date_created, id) keyset."""
+    return queryset.order_by('date_created', 'id')
+
+
+def seek(queryset, date_created, target_id):
+    """Filter Targets to those positioned after (date_created, id)."""
+    return queryset.filter(
+        Q(date_created__gt=date_created) |
+        Q(date_created=date_created, id__gt=target_id))
+
+
+def iter_target_chunks(queryset, chunk_size):
+    """Iterate over all Targets as chunks of value dictionaries."""
+    queryset = order_by_keyset(queryset)
+    position = None
+    while True:
+        chunk = queryset if position is None else seek(queryset, *position)
+        rows = list(chunk[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        position = (rows[-1]['date_created'], rows[-1]['id'])
+
+
+def paginate_targets(queryset, limit, cursor=None):
+    """Get one page of Targets and the cursor for the next page."""
+    queryset = order_by_keyset(queryset)
+    if cursor:
+        queryset = seek(queryset, *decode_cursor(cursor))
+    # fetch one extra row to find out if there is a next page
+    page = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1])
+    return page, next_cursor
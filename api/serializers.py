@@ -1,11 +1,13 @@
 """API Django serializers."""
+import json
 import re
 
 import netaddr
 from rest_framework import serializers
 import validators
 
-from api.models import Target
+from api.models import PluginJob, Target, TargetIpRange
+from api.utils import ip_target_bounds, merge_ip_ranges, overlaps_ip_ranges
 from plugins.interfaces import TargetInterface
 
 REGEX_IPV4 = re.compile(
@@ -33,9 +35,19 @@ REGEX_URL = re.compile(
     r'[a-zA-Z]{2,}'
     r"/[-a-zA-Z0-9._~!$&'()*+,;=:@%#/?&]*$"
 )
-REGEX_MD5 = re.compile(r'^[0-9a-fA-F]{32}$')
-REGEX_SHA1 = re.compile(r'^[0-9a-fA-F]{40}$')
-REGEX_SHA256 = re.compile(r'^[0-9a-fA-F]{64}$')
+# sorted, disjoint blocks of the addresses is_ipaddr_public rejects
+NON_PUBLIC_IPV4_RANGES = list(merge_ip_ranges(sorted(
+    (block.first, block.last) for block in
+    netaddr.ip.IPV4_PRIVATE + (
+        netaddr.ip.IPV4_LOOPBACK,
+        netaddr.ip.IPV4_LINK_LOCAL,
+        netaddr.ip.IPV4_MULTICAST,
+    )
+)))
+# MD5, SHA1 or SHA256
+REGEX_HASH = re.compile(
+    r'^(?:[0-9a-fA-F]{32}|[0-9a-fA-F]{40}|[0-9a-fA-F]{64})$')
+USERNAME_INVALID_CHARS = '/\\[]":;|<>+=,?*@'
 
 
 def is_ipaddr_public(ipaddr):
@@ -85,23 +97,20 @@ def verify_ip_cidr(ipnet):
 
 def verify_ip_range(iprange):
     """Verifies IP address range."""
-    iprange = iprange.split('-')
     try:
-        iplist = list(netaddr.iter_iprange(iprange[0], iprange[1]))
+        first, last = ip_target_bounds(iprange)
     except netaddr.core.AddrFormatError:
         raise serializers.ValidationError(
             {'target': ['Invalid IP range notation.']})
-    # iter_iprange may return an empty list instead of erroring
-    if not iplist:
+    if first > last:
         raise serializers.ValidationError(
             {'target': ['Invalid IP range notation.']})
-    if len(iplist) > 65536:
+    if last - first + 1 > 65536:
         raise serializers.ValidationError(
             {'target': ['IP ranges are limited to a /16.']})
-    for ipaddr in iplist:
-        if not is_ipaddr_public(ipaddr):
-            raise serializers.ValidationError(
-                {'target': ['Only public IP addresses can be added.']})
+    if overlaps_ip_ranges(NON_PUBLIC_IPV4_RANGES, first, last):
+        raise serializers.ValidationError(
+            {'target': ['Only public IP addresses can be added.']})
 
 
 def verify_domain(domain):
@@ -132,8 +141,7 @@ def verify_url(url):
 
 def verify_hash(target):
     """Verifies if valid hash."""
-    if not (REGEX_MD5.match(target) or REGEX_SHA1.match(target) or
-            REGEX_SHA256.match(target)):
+    if not REGEX_HASH.match(target):
         raise serializers.ValidationError(
             {'target': ['Invalid hash format.']})
 
@@ -144,12 +152,11 @@ def verify_username(username):
         # Windows Active Directory Logon Name rules
         # https://technet.microsoft.com/en-us/library/bb726984.aspx
         validators.length(username, min=1, max=104)
-        invalid_chars = list('/\\[]":;|<>+=,?*@')
-        if any(c in invalid_chars for c in username):
+        if any(c in USERNAME_INVALID_CHARS for c in username):
             raise serializers.ValidationError(
                 {'target': [
                     'Username cannot contain the following characters: %s' % (
-                        ''.join(invalid_chars))
+                        USERNAME_INVALID_CHARS)
                 ]}
             )
     except validators.ValidationFailure:
@@ -162,20 +169,78 @@ def verify_plugin_method(target, target_type, requested_method):
     target = TargetInterface(target, target_type)
     if requested_method.lower() == 'none':
         return
-    elif requested_method in target.methods:
+    elif target.has_method(requested_method):
         return
     raise serializers.ValidationError(
         {'method': ['Invalid plugin method.']})
 
 
-def whitelisted(target, target_type):
+def whitelisted(target, target_type, target_action=Target.BAN):
     """Checks if the target has already been added as an Allow."""
-    try:
-        Target.objects.get(
-            target=target, target_type=target_type, target_action=Target.ALLOW)
-    except Target.DoesNotExist:
-        return False
-    return True
+    if target_type == Target.IPADDR and target_action == Target.BAN:
+        # IP Targets are not banned if any part of their range is allowed
+        first, last = ip_target_bounds(target)
+        return TargetIpRange.objects.filter(
+            ipaddr_action=Target.ALLOW,
+        ).overlapping(first, last).exists()
+    return Target.objects.filter(
+        target=target, target_type=target_type,
+        target_action=Target.ALLOW).exists()
+
+
+def whitelisted_targets(targets):
+    """Get the (target, target_type, target_action) items already allowed."""
+    targets = [(tgt, tgt_type, action) for tgt, tgt_type, action in targets
+               if isinstance(tgt, basestring)]
+    if not targets:
+        return set()
+    exact = set(Target.objects.filter(
+        target__in=[tgt for tgt, _, _ in targets],
+        target_action=Target.ALLOW).values_list('target', 'target_type'))
+    allowed = set(
+        (tgt, tgt_type, action) for tgt, tgt_type, action in targets
+        if (tgt, tgt_type) in exact)
+    # IP Targets are not banned if any part of their range is allowed
+    bounds = {}
+    for tgt, tgt_type, action in targets:
+        if tgt_type == Target.IPADDR and action == Target.BAN:
+            try:
+                bounds[tgt] = ip_target_bounds(tgt)
+            except (netaddr.core.AddrFormatError, ValueError, TypeError):
+                # invalid IP Targets are rejected by the serializer
+                continue
+    if bounds:
+        ranges = list(merge_ip_ranges(TargetIpRange.objects.filter(
+            ipaddr_action=Target.ALLOW,
+        ).overlapping(
+            min(first for first, _ in bounds.values()),
+            max(last for _, last in bounds.values()),
+        ).order_by('first_ipaddr').values_list(
+            'first_ipaddr', 'last_ipaddr')))
+        allowed.update(
+            (tgt, Target.IPADDR, Target.BAN)
+            for tgt, (first, last) in bounds.items()
+            if overlaps_ip_ranges(ranges, first, last))
+    return allowed
+
+
+def whitelisted_in_batch(targets):
+    """Get the (target, target_type, Ban) items allowed by another item."""
+    exact = set(
+        (tgt, tgt_type) for tgt, tgt_type, action in targets
+        if action == Target.ALLOW)
+    ranges = list(merge_ip_ranges(sorted(
+        ip_target_bounds(tgt) for tgt, tgt_type, action in targets
+        if tgt_type == Target.IPADDR and action == Target.ALLOW)))
+    allowed = set()
+    for tgt, tgt_type, action in targets:
+        if action != Target.BAN:
+            continue
+        if (tgt, tgt_type) in exact or (
+                tgt_type == Target.IPADDR and
+                overlaps_ip_ranges(ranges, *ip_target_bounds(tgt))):
+            allowed.add((tgt, tgt_type, action))
+    return allowed
 
 
 class TargetSerializer(serializers.ModelSerializer):
@@ -210,7 +275,14 @@ class TargetSerializer(serializers.ModelSerializer):
         target_type = data['target_type']
         method = data['method']
 
-        if target_type == Target.IPADDR:
+        # bulk requests validate the format of all targets up front
+        verdicts = self.context.get('verdicts', {})
+        if (target, target_type) in verdicts:
+            if verdicts[(target, target_type)]:
+                raise serializers.ValidationError(
+                    verdicts[(target, target_type)])
+            verify_plugin_method(target, target_type, method)
+        elif target_type == Target.IPADDR:
             verify_ip(target)
             verify_plugin_method(target, target_type, method)
         elif target_type == Target.DOMAIN:
@@ -226,8 +298,38 @@ class TargetSerializer(serializers.ModelSerializer):
             verify_username(target)
             verify_plugin_method(target, target_type, method)
 
-        if whitelisted(target, target_type):
+        # bulk requests resolve the whitelist for all targets up front
+        allowed = self.context.get('whitelisted')
+        if allowed is not None:
+            is_whitelisted = (
+                target, target_type, data['target_action']) in allowed
+        else:
+            is_whitelisted = whitelisted(
+                target, target_type, data['target_action'])
+        if is_whitelisted:
             raise serializers.ValidationError(
                 {'target': ['Target is whitelisted and cannot be banned.']})
 
         return data
+
+
+class PluginJobSerializer(serializers.ModelSerializer):
+    """Definition of a PluginJob Serializer."""
+    errors = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PluginJob
+        fields = (
+            'id',
+            'target',
+            'method',
+            'status',
+            'errors',
+            'attempts',
+            'date_created',
+            'last_modified',
+        )
+        read_only_fields = fields
+
+    def get_errors(self, job):
+        return json.loads(job.errors) if job.errors else {}
@@ -1,10 +1,10 @@
 """API Django signals."""
 import logging
 
-from django.core.exceptions import ValidationError
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from api.counters import add_to_count
 from api.models import Target
 
 # get api logger
@@ -14,16 +14,15 @@ LOGGER = logging.getLogger(__name__)
 @receiver(pre_save, sender=Target)
 def limit_block_entries(sender, instance, **kwargs):
     """Limit IP, Domain, and URL blocks to 10K entries."""
-    limit = 10000
-    limited_types = {Target.IPADDR, Target.DOMAIN, Target.URL}
-    if (instance.target_action == Target.BAN and
-            instance.target_type in limited_types and
-            Target.objects.filter(
-                target_action=Target.BAN,
-                target_type=instance.target_type).count() >= limit):
-        # count has exceeded limit
-        raise ValidationError(
-            {'target': 'Exceeded %s %s instances.' % (limit, Target.BAN)})
+    if instance.pk is None:
+        # raises if the count has exceeded the limit
+        add_to_count(instance.target_type, instance.target_action, 1)
+
+
+@receiver(post_delete, sender=Target)
+def count_deletion(sender, instance, **kwargs):
+    """Keep the count of Targets up to date after a deletion."""
+    add_to_count(instance.target_type, instance.target_action, -1)
 
 
 @receiver(post_save, sender=Target)
@@ -44,3 +43,4 @@ def log_creation(sender, instance, created, **kwargs):
             )
         )
         LOGGER.info(msg)
+
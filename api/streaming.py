@@ -0,0 +1,33 @@
+"""Streaming JSON encoding of Target listings."""
+import json
+
+from api.pagination import iter_target_chunks
+from api.serializers import TargetSerializer
+
+CHUNK_SIZE = 2000
+
+
+def format_datetime(value):
+    """Format a datetime the same way the REST framework serializer does."""
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def encode_row(row):
+    """Encode a Target value dictionary as JSON."""
+    row['date_created'] = format_datetime(row['date_created'])
+    row['last_modified'] = format_datetime(row['last_modified'])
+    return json.dumps(row)
+
+
+def stream_targets(queryset, chunk_size=CHUNK_SIZE):
+    """Yield a JSON array of Targets, encoding one chunk at a time."""
+    rows = queryset.values(*TargetSerializer.Meta.fields)
+    yield '['
+    separator = ''
+    for chunk in iter_target_chunks(rows, chunk_size):
+        yield separator + ','.join(encode_row(row) for row in chunk)
+        separator = ','
+    yield ']'
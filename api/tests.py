@@ -1,4 +1,832 @@
 """API tests."""
-from django.test import TestCase
+from datetime import timedelta
+import json
+import os
+import tempfile
+import threading
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from api import counters, jobs, views
+from api.models import (
+    EBL_METHOD, PluginJob, Target, TargetCount, TargetIpRange)
+from api.pagination import decode_cursor, encode_cursor, paginate_targets
+from api.serializers import (
+    TargetSerializer, verify_domain, verify_hash, verify_ip, verify_url,
+    verify_username)
+from api.streaming import stream_targets
+from api.utils import (
+    int_to_ipaddr, ip_target_bounds, merge_ip_ranges, overlaps_ip_ranges,
+    subtract_ip_ranges)
+from api.validation import validate_targets
+from plugins import config, interfaces
+from plugins.exceptions import PluginError
+from plugins.ip_plugins.paloaltonetworks import PaloAltoNetworks
+
+
+def create_target(target, target_type=Target.IPADDR,
+                  target_action=Target.BAN, method='other'):
+    """Create a Target without running any plugin method."""
+    return Target.objects.create(
+        target=target,
+        target_type=target_type,
+        target_action=target_action,
+        reason='test',
+        method=method,
+        user='test',
+    )
+
+
+class AuthenticatedTestCase(APITestCase):
+    """Test case with a client authenticated as a user."""
+    def setUp(self):
+        self.user = User.objects.create_user('tester')
+        self.client.force_authenticate(self.user)
+
+    def patch(self, obj, name, value):
+        """Replace an attribute for the duration of the test."""
+        self.addCleanup(setattr, obj, name, getattr(obj, name))
+        setattr(obj, name, value)
+
+    def post_target(self, target, target_type=Target.IPADDR,
+                    target_action=Target.BAN, method=EBL_METHOD):
+        """Add a Target through the API."""
+        return self.client.post('/api/v1/targets/', {
+            'target': target,
+            'target_type': target_type,
+            'target_action': target_action,
+            'reason': 'test',
+            'method': method,
+        })
+
+
+class PaginationTests(AuthenticatedTestCase):
+    """Keyset cursor pagination of Target listings."""
+    def setUp(self):
+        super(PaginationTests, self).setUp()
+        self.targets = [
+            create_target('%s.example.com' % i, Target.DOMAIN)
+            for i in range(5)]
+        # share a date_created, so only the id breaks ties
+        Target.objects.filter(
+            id__in=[t.id for t in self.targets[1:4]]).update(
+                date_created=timezone.now())
+
+    def test_pages_cover_all_targets_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = paginate_targets(
+                Target.objects.all(), 2, cursor)
+            seen.extend(target.id for target in page)
+            if cursor is None:
+                break
+        expected = list(Target.objects.order_by(
+            'date_created', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_round_trip(self):
+        target = Target.objects.get(id=self.targets[2].id)
+        self.assertEqual(
+            decode_cursor(encode_cursor(target)),
+            (target.date_created, target.id))
+
+    def test_invalid_cursor(self):
+        for cursor in ('x', 'bm90IGEgY3Vyc29y'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_view_returns_next_cursor(self):
+        response = self.client.get('/api/v1/targets/', {'limit': 2})
+        data = json.loads(response.content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['results']), 2)
+        response = self.client.get(
+            '/api/v1/targets/', {'limit': 10, 'cursor': data['next']})
+        data = json.loads(response.content)
+        self.assertEqual(len(data['results']), 3)
+        self.assertIsNone(data['next'])
+
+    def test_view_rejects_bad_parameters(self):
+        response = self.client.get('/api/v1/targets/', {'limit': 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/v1/targets/', {'cursor': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamingTests(AuthenticatedTestCase):
+    """Streamed Target listings."""
+    def setUp(self):
+        super(StreamingTests, self).setUp()
+        for i in range(5):
+            create_target('%s.example.com' % i, Target.DOMAIN)
+        create_target('198.51.100.1')
+
+    def serialized(self, targets):
+        """Get Targets as the REST framework serializer renders them."""
+        return json.loads(json.dumps(TargetSerializer(
+            targets.order_by('date_created', 'id'), many=True).data))
+
+    def test_chunks_form_one_array(self):
+        targets = Target.objects.all()
+        self.assertEqual(
+            json.loads(''.join(stream_targets(targets, chunk_size=2))),
+            self.serialized(targets))
+
+    def test_empty_listing(self):
+        self.assertEqual(
+            ''.join(stream_targets(Target.objects.none())), '[]')
+
+    def test_view_streams_targets_of_a_type(self):
+        response = self.client.get(
+            '/api/v1/targets/domain/', {'stream': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(''.join(response.streaming_content)),
+            self.serialized(Target.objects.filter(target_type=Target.DOMAIN)))
+
+
+class DataTablesTests(AuthenticatedTestCase):
+    """Server-side processing of the web ban list."""
+    def setUp(self):
+        super(DataTablesTests, self).setUp()
+        for target in ('b.example.com', 'a.example.com', 'c.example.org'):
+            create_target(target, Target.DOMAIN)
+
+    def get_page(self, **params):
+        """Get a page of the ban list, ordered by target."""
+        params.setdefault('columns[0][data]', 'target')
+        params.setdefault('order[0][column]', '0')
+        params.setdefault('order[0][dir]', 'asc')
+        return json.loads(self.client.get(
+            '/api/v1/targets/datatables/', params).content)
+
+    def test_page_of_ordered_targets(self):
+        data = self.get_page(draw=3, start=1, length=1)
+        self.assertEqual(data['draw'], 3)
+        self.assertEqual(data['recordsTotal'], 3)
+        self.assertEqual(data['recordsFiltered'], 3)
+        self.assertEqual(
+            [item['target'] for item in data['data']], ['b.example.com'])
+
+    def test_search_filters_targets(self):
+        data = self.get_page(**{'search[value]': 'EXAMPLE.COM'})
+        self.assertEqual(data['recordsTotal'], 3)
+        self.assertEqual(data['recordsFiltered'], 2)
+        self.assertEqual(
+            [item['target'] for item in data['data']],
+            ['a.example.com', 'b.example.com'])
+
+    def test_unknown_order_column_is_ignored(self):
+        data = self.get_page(**{
+            'columns[0][data]': 'id; DROP TABLE', 'order[0][dir]': 'desc'})
+        self.assertEqual(
+            [item['target'] for item in data['data']],
+            ['c.example.org', 'a.example.com', 'b.example.com'])
+
+
+class PluginJobTests(AuthenticatedTestCase):
+    """Plugin methods queued as jobs and run by workers."""
+    def setUp(self):
+        super(PluginJobTests, self).setUp()
+        self.calls = []
+        self.patch(PaloAltoNetworks, 'add_to_ebl',
+                   lambda plugin: self.calls.append(plugin.ipaddr))
+
+    def test_post_queues_job_without_running_it(self):
+        response = self.post_target('198.51.100.1')
+        self.assertEqual(response.status_code, 201)
+        job = PluginJob.objects.get(id=json.loads(response.content)['job'])
+        self.assertEqual(job.status, PluginJob.PENDING)
+        self.assertEqual(self.calls, [])
+
+    def test_method_none_has_no_job(self):
+        target = create_target('198.51.100.2', method='none')
+        self.assertEqual(jobs.enqueue_jobs([target]), [])
+
+    def test_worker_runs_job(self):
+        job_id = json.loads(self.post_target('198.51.100.3').content)['job']
+        jobs.run_job(jobs.claim_job())
+        self.assertEqual(self.calls, ['198.51.100.3'])
+        data = json.loads(self.client.get('/api/v1/jobs/%s' % job_id).content)
+        self.assertEqual(data['status'], PluginJob.SUCCEEDED)
+        self.assertIsNone(jobs.claim_job())
+
+    def test_failed_job_records_errors(self):
+        def add_to_ebl(plugin):
+            raise PluginError('Firewall unreachable.', 'paloaltonetworks')
+        self.patch(PaloAltoNetworks, 'add_to_ebl', add_to_ebl)
+        job_id = json.loads(self.post_target('198.51.100.4').content)['job']
+        jobs.run_job(jobs.claim_job())
+        data = json.loads(self.client.get('/api/v1/jobs/%s' % job_id).content)
+        self.assertEqual(data['status'], PluginJob.FAILED)
+        self.assertEqual(
+            data['errors'], {'paloaltonetworks': ['Firewall unreachable.']})
+
+    def abandon(self, job, attempts):
+        """Make a job look abandoned by its worker."""
+        PluginJob.objects.filter(id=job.id).update(
+            status=PluginJob.RUNNING,
+            attempts=attempts,
+            last_modified=timezone.now() - timedelta(
+                seconds=jobs.HEARTBEAT_TIMEOUT + 1))
+
+    def test_running_job_is_not_retried_before_heartbeat_expires(self):
+        self.post_target('198.51.100.5')
+        self.assertIsNotNone(jobs.claim_job())
+        self.assertIsNone(jobs.claim_job())
+
+    def test_abandoned_job_is_retried(self):
+        self.post_target('198.51.100.6')
+        job = jobs.claim_job()
+        self.abandon(job, 1)
+        retried = jobs.claim_job()
+        self.assertEqual(retried.id, job.id)
+        self.assertEqual(retried.attempts, 2)
+
+    def test_exhausted_job_fails(self):
+        self.post_target('198.51.100.7')
+        job = jobs.claim_job()
+        self.abandon(job, jobs.MAX_ATTEMPTS)
+        self.assertIsNone(jobs.claim_job())
+        job = PluginJob.objects.get(id=job.id)
+        self.assertEqual(job.status, PluginJob.FAILED)
+        self.assertIn('job', json.loads(job.errors))
+
+    def test_job_taken_over_by_a_retry_is_skipped(self):
+        self.post_target('198.51.100.8')
+        job = jobs.claim_job()
+        self.abandon(job, 1)
+        retried = jobs.claim_job()
+        jobs.run_job(job)
+        self.assertEqual(self.calls, [])
+        jobs.run_job(retried)
+        self.assertEqual(self.calls, ['198.51.100.8'])
+        job = PluginJob.objects.get(id=job.id)
+        self.assertEqual(job.status, PluginJob.SUCCEEDED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_result_of_a_job_taken_over_is_dropped(self):
+        self.post_target('198.51.100.9')
+        job = jobs.claim_job()
+
+        def add_to_ebl(plugin):
+            # the worker missed its heartbeats while the method ran
+            self.abandon(job, 1)
+            jobs.claim_job()
+        self.patch(PaloAltoNetworks, 'add_to_ebl', add_to_ebl)
+        jobs.run_job(job)
+        job = PluginJob.objects.get(id=job.id)
+        self.assertEqual(job.status, PluginJob.RUNNING)
+        self.assertEqual(job.attempts, 2)
+
+    def test_jobs_run_by_weight(self):
+        class FakeJob(object):
+            def __init__(self, method):
+                self.method = method
+        self.patch(jobs, 'get_method_weights', lambda: {'a': 2, 'b': 1})
+        order = []
+        self.patch(
+            jobs, 'run_pooled_job', lambda job: order.append(job.method))
+        jobs.run_jobs_by_weight(
+            [FakeJob(method) for method in ('c', 'b', 'a', 'c', 'a')])
+        self.assertEqual(order[:2], ['a', 'a'])
+        self.assertEqual(order[2:], ['b', 'c', 'c'])
+
+    def test_unknown_job(self):
+        response = self.client.get('/api/v1/jobs/999999')
+        self.assertEqual(response.status_code, 404)
+
+
+class GroupPermissionTests(AuthenticatedTestCase):
+    """Permissions granted through the groups of a user."""
+    def setUp(self):
+        super(GroupPermissionTests, self).setUp()
+        self.patch(views, 'group_perms_enabled', True)
+        self.group = Group.objects.get(
+            name=settings.GROUP_NAMES['IPADDR_READWRITE'])
+        self.user.groups.add(self.group)
+
+    def test_permissions_follow_groups(self):
+        self.assertTrue(views.permission_to_read(self.user, Target.IPADDR))
+        self.assertTrue(views.permission_to_write(self.user, Target.IPADDR))
+        self.assertFalse(views.permission_to_read(self.user, Target.DOMAIN))
+
+    def test_permissions_are_memoized_per_request(self):
+        views.get_user_permissions(self.user)
+        with self.assertNumQueries(0):
+            views.permission_to_read(self.user, Target.IPADDR)
+            views.permission_to_write(self.user, Target.DOMAIN)
+
+    def test_targets_of_readable_types(self):
+        self.user.groups.add(Group.objects.get(
+            name=settings.GROUP_NAMES['URL_READWRITE']))
+        for target, target_type in (
+                ('198.51.100.1', Target.IPADDR),
+                ('evil.com', Target.DOMAIN),
+                ('evil.com/x', Target.URL)):
+            create_target(target, target_type)
+        with self.assertNumQueries(2):
+            # one query for the permissions, and one for the Targets
+            self.assertEqual(
+                sorted(views.get_all_targets(self.user).values_list(
+                    'target', flat=True)),
+                ['198.51.100.1', 'evil.com/x'])
+
+    def test_revoked_group_applies_to_next_request(self):
+        response = self.client.get('/api/v1/targets/ip/')
+        self.assertEqual(response.status_code, 200)
+        self.user.groups.remove(self.group)
+        # each request loads the user again
+        self.client.force_authenticate(User.objects.get(id=self.user.id))
+        response = self.client.get('/api/v1/targets/ip/')
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkTests(AuthenticatedTestCase):
+    """Bulk submission of targets."""
+    def item(self, target, target_type=Target.DOMAIN):
+        """Get a banned target item of a bulk request."""
+        return {'target': target, 'target_type': target_type,
+                'target_action': Target.BAN, 'reason': 'test',
+                'method': EBL_METHOD}
+
+    def test_ndjson(self):
+        body = '\n'.join(json.dumps(self.item(target)) for target in (
+            'evil.com', 'worse.com'))
+        response = self.client.generic(
+            'POST', '/api/v1/targets/bulk/', body + '\n',
+            content_type='application/x-ndjson')
+        results = json.loads(response.content)
+        self.assertEqual([item['status'] for item in results], [201, 201])
+        self.assertEqual(
+            [item['target']['target'] for item in results],
+            ['evil.com', 'worse.com'])
+        self.assertEqual(
+            PluginJob.objects.filter(
+                id__in=[item['job'] for item in results]).count(), 2)
+
+    def test_each_item_gets_its_result(self):
+        response = self.client.post('/api/v1/targets/bulk/', [
+            self.item('evil.com'),
+            'evil.com',
+            self.item('1.2.3', Target.IPADDR),
+            self.item('198.51.100.1', Target.IPADDR),
+        ], format='json')
+        results = json.loads(response.content)
+        self.assertEqual(
+            [item['status'] for item in results], [201, 400, 400, 201])
+        self.assertEqual(
+            results[1]['errors'], {'non_field_errors': ['Invalid data.']})
+        self.assertEqual(
+            results[2]['errors'], {'target': ['Invalid IP format.']})
+
+    def test_items_need_write_permission(self):
+        self.patch(views, 'group_perms_enabled', True)
+        response = self.client.post(
+            '/api/v1/targets/bulk/', [self.item('evil.com')], format='json')
+        self.assertEqual(json.loads(response.content)[0]['status'], 403)
+        self.assertFalse(Target.objects.exists())
+
+    def test_body_must_be_a_list(self):
+        response = self.client.post(
+            '/api/v1/targets/bulk/', self.item('evil.com'), format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class IpRangeTests(AuthenticatedTestCase):
+    """IP Targets stored as address ranges."""
+    def test_range_of_each_notation(self):
+        for target, first, last in (
+                ('198.51.100.7', '198.51.100.7', '198.51.100.7'),
+                ('198.51.100.0/30', '198.51.100.0', '198.51.100.3'),
+                ('198.51.100.8-198.51.100.20', '198.51.100.8',
+                 '198.51.100.20')):
+            self.assertEqual(self.post_target(target).status_code, 201)
+            ip_range = TargetIpRange.objects.get(target__target=target)
+            self.assertEqual(
+                (int_to_ipaddr(ip_range.first_ipaddr),
+                 int_to_ipaddr(ip_range.last_ipaddr)), (first, last))
+            self.assertEqual(ip_range.ipaddr_action, Target.BAN)
+            self.assertEqual(ip_range.method, EBL_METHOD)
+
+    def test_overlapping_bans_share_addresses(self):
+        self.assertEqual(self.post_target('198.51.100.0/24').status_code, 201)
+        self.assertEqual(self.post_target('198.51.100.5').status_code, 201)
+        self.assertEqual(TargetIpRange.objects.count(), 2)
+
+    def test_overlapping_ranges_include_both_ends(self):
+        self.post_target('198.51.100.8-198.51.100.15')
+        first, last = ip_target_bounds('198.51.100.8-198.51.100.15')
+        for query_first, query_last, count in (
+                (first - 8, first - 1, 0), (first - 8, first, 1),
+                (first + 2, last - 2, 1), (last, last + 8, 1),
+                (last + 1, last + 8, 0), (first - 8, last + 8, 1)):
+            self.assertEqual(TargetIpRange.objects.overlapping(
+                query_first, query_last).count(), count)
+
+    def test_allow_of_banned_range_is_rejected(self):
+        self.post_target('198.51.100.0/24')
+        response = self.post_target(
+            '198.51.100.5', target_action=Target.ALLOW)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'target': [
+            'Target "198.51.100.0/24" is already marked for action "ban"']})
+        self.assertFalse(Target.objects.filter(
+            target_action=Target.ALLOW).exists())
+
+
+class DeleteTargetTests(AuthenticatedTestCase):
+    """Deletion of Targets and the rows that refer to them."""
+    def test_delete_removes_range_and_jobs(self):
+        target_id = json.loads(self.post_target('198.51.100.0/24').content)[
+            'id']
+        self.post_target('198.51.100.5')
+        response = self.client.delete('/api/v1/targets/%s' % target_id)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Target.objects.filter(id=target_id).exists())
+        self.assertFalse(TargetIpRange.objects.filter(
+            target_id=target_id).exists())
+        self.assertFalse(PluginJob.objects.filter(
+            target_id=target_id).exists())
+        self.assertEqual(
+            list(TargetIpRange.objects.values_list(
+                'target__target', flat=True)), ['198.51.100.5'])
+
+    def test_delete_unknown_target(self):
+        response = self.client.delete('/api/v1/targets/999999')
+        self.assertEqual(response.status_code, 404)
+
+
+class TargetCountTests(AuthenticatedTestCase):
+    """Maintained counts of Targets and the ban limit."""
+    def get_count(self, target_type=Target.DOMAIN):
+        """Get the count of banned Targets of a type."""
+        return TargetCount.objects.get(
+            target_type=target_type, target_action=Target.BAN).count
+
+    def test_count_follows_saves_and_deletes(self):
+        create_target('evil.com', Target.DOMAIN)
+        # the first save starts the counter from the rows already saved
+        self.assertEqual(self.get_count(), 1)
+        target = create_target('worse.com', Target.DOMAIN)
+        self.assertEqual(self.get_count(), 2)
+        target.delete()
+        self.assertEqual(self.get_count(), 1)
+
+    def test_ban_limit(self):
+        self.patch(counters, 'BAN_LIMIT', 2)
+        for target in ('evil.com', 'worse.com'):
+            response = self.post_target(target, Target.DOMAIN)
+            self.assertEqual(response.status_code, 201)
+        response = self.post_target('worst.com', Target.DOMAIN)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_count(), 2)
+        # allows and unlimited types are not counted against the limit
+        response = self.post_target(
+            'fine.com', Target.DOMAIN, target_action=Target.ALLOW)
+        self.assertEqual(response.status_code, 201)
+
+    def test_bulk_ban_limit(self):
+        self.patch(counters, 'BAN_LIMIT', 2)
+        create_target('evil.com', Target.DOMAIN)
+        response = self.client.post('/api/v1/targets/bulk/', [
+            {'target': target, 'target_type': Target.DOMAIN,
+             'target_action': Target.BAN, 'reason': 'test',
+             'method': EBL_METHOD}
+            for target in ('worse.com', 'worst.com')
+        ], format='json')
+        self.assertEqual(
+            [item['status'] for item in json.loads(response.content)],
+            [400, 400])
+        self.assertEqual(self.get_count(), 1)
+
+
+class IpRangeHelperTests(TestCase):
+    """Arithmetic on (first, last) IP address ranges."""
+    def test_bounds(self):
+        self.assertEqual(
+            ip_target_bounds('0.0.0.1-0.0.1.0'), (1, 256))
+        self.assertEqual(ip_target_bounds('0.0.1.0/24'), (256, 511))
+        self.assertEqual(ip_target_bounds('0.0.0.9'), (9, 9))
+
+    def test_merge(self):
+        self.assertEqual(
+            list(merge_ip_ranges([(1, 3), (2, 5), (6, 6), (9, 10)])),
+            [(1, 6), (9, 10)])
+        self.assertEqual(list(merge_ip_ranges([])), [])
+
+    def test_overlaps(self):
+        ranges = [(10, 20), (30, 40)]
+        self.assertTrue(overlaps_ip_ranges(ranges, 20, 25))
+        self.assertTrue(overlaps_ip_ranges(ranges, 0, 100))
+        self.assertFalse(overlaps_ip_ranges(ranges, 21, 29))
+        self.assertFalse(overlaps_ip_ranges(ranges, 41, 50))
+        self.assertFalse(overlaps_ip_ranges([], 0, 100))
+
+    def test_subtract(self):
+        self.assertEqual(
+            list(subtract_ip_ranges(0, 50, [(10, 20), (30, 40)])),
+            [(0, 9), (21, 29), (41, 50)])
+        self.assertEqual(list(subtract_ip_ranges(12, 18, [(10, 20)])), [])
+
+
+class WhitelistTests(AuthenticatedTestCase):
+    """Bans of allowed targets, and allows overlapping other allows."""
+    def setUp(self):
+        super(WhitelistTests, self).setUp()
+        response = self.post_target('198.51.100.5', target_action=Target.ALLOW)
+        self.assertEqual(response.status_code, 201)
+
+    def test_ban_overlapping_allow_is_rejected(self):
+        for target in ('198.51.100.0/24', '198.51.100.1-198.51.100.9'):
+            response = self.post_target(target)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                json.loads(response.content),
+                {'target': ['Target is whitelisted and cannot be banned.']})
+
+    def test_ban_next_to_allow_is_accepted(self):
+        response = self.post_target('198.51.100.6')
+        self.assertEqual(response.status_code, 201)
+
+    def test_allow_overlapping_allow_is_accepted(self):
+        response = self.post_target(
+            '198.51.100.0/24', target_action=Target.ALLOW)
+        self.assertEqual(response.status_code, 201)
+
+    def test_same_allow_is_rejected(self):
+        response = self.post_target(
+            '198.51.100.5', target_action=Target.ALLOW)
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_checks_each_action(self):
+        response = self.client.post('/api/v1/targets/bulk/', [
+            {'target': '198.51.100.0/24', 'target_type': Target.IPADDR,
+             'target_action': action, 'reason': 'test', 'method': EBL_METHOD}
+            for action in (Target.ALLOW, Target.BAN)
+        ], format='json')
+        statuses = [item['status'] for item in json.loads(response.content)]
+        self.assertEqual(statuses, [201, 400])
+
+    def post_bulk(self, targets):
+        """Add (target, target_type, target_action) items in one batch."""
+        response = self.client.post('/api/v1/targets/bulk/', [
+            {'target': target, 'target_type': target_type,
+             'target_action': target_action, 'reason': 'test',
+             'method': EBL_METHOD}
+            for target, target_type, target_action in targets
+        ], format='json')
+        return json.loads(response.content)
+
+    def test_bulk_checks_bans_against_allows_of_the_batch(self):
+        results = self.post_bulk([
+            ('evil.com', Target.DOMAIN, Target.BAN),
+            ('evil.com', Target.DOMAIN, Target.ALLOW),
+            ('198.51.100.64/26', Target.IPADDR, Target.BAN),
+            ('198.51.100.70', Target.IPADDR, Target.ALLOW),
+            ('worse.com', Target.DOMAIN, Target.BAN),
+        ])
+        self.assertEqual(
+            [item['status'] for item in results], [400, 201, 400, 201, 201])
+        self.assertEqual(
+            results[0]['errors'],
+            {'target': ['Target is whitelisted and cannot be banned.']})
+        self.assertFalse(Target.objects.filter(
+            target='evil.com', target_action=Target.BAN).exists())
+
+
+class IpValidationTests(TestCase):
+    """Validation of IP addresses, CIDRs and ranges."""
+    def get_error(self, target):
+        """Get the error verify_ip raises for a target, if any."""
+        try:
+            verify_ip(target)
+        except serializers.ValidationError as err:
+            return err.detail['target'][0]
+        return None
+
+    def test_ranges(self):
+        for target, error in (
+                ('198.51.0.0-198.51.255.255', None),
+                ('198.51.0.0-198.52.0.0', 'IP ranges are limited to a /16.'),
+                ('198.51.100.9-198.51.100.1', 'Invalid IP range notation.'),
+                ('9.255.255.255-10.0.0.0',
+                 'Only public IP addresses can be added.'),
+                ('9.255.255.0-9.255.255.255', None),
+                ('11.0.0.0-11.0.0.255', None)):
+            self.assertEqual(self.get_error(target), error, target)
+
+    def test_cidrs(self):
+        for target, error in (
+                ('198.51.0.0/16', None),
+                ('198.0.0.0/15', 'IP ranges are limited to a /16.'),
+                ('10.1.0.0/16', 'Only public IP addresses can be added.')):
+            self.assertEqual(self.get_error(target), error, target)
+
+
+class ValidationParityTests(TestCase):
+    """Batch validation gives the same verdicts as the single validators."""
+    SAMPLES = (
+        (Target.IPADDR, verify_ip, (
+            '198.51.100.1', '8.8.8.8', '10.0.0.1', '127.0.0.1',
+            '169.254.1.1', '224.0.0.1', '0.0.0.0', '255.255.255.255',
+            '256.1.1.1', '1.2.3', '1.2.3.4/', '1.2.3.4-', ' 1.2.3.4',
+            'evil.com', '', '198.51.100.0/24', '198.51.0.0/16',
+            '198.0.0.0/15', '198.51.100.7/0', '10.0.0.0/8', '9.0.0.0/7',
+            '172.16.0.0/33', '198.51.100.1-198.51.100.9',
+            '198.51.100.9-198.51.100.1', '198.51.0.0-198.52.0.0',
+            '9.255.255.0-10.0.0.5', '198.051.100.1', '198.51.100.01/24',
+            '198.51.100.1-198.51.100.010', '010.0.0.1',
+        )),
+        (Target.DOMAIN, verify_domain, (
+            'evil.com', 'sub.evil.co.uk', 'xn--evil-9na.com', 'evil',
+            'evil.c', '-evil.com', 'evil-.com', 'ev_il.com', 'evil.co1',
+            'evil..com', '',
+        )),
+        (Target.URL, verify_url, (
+            'evil.com/', 'evil.com/a?b=1', '*.evil.com/path', 'evil.com',
+            'http://evil.com/', 'evil.com/ x', '*evil.com/', '',
+        )),
+        (Target.HASH, verify_hash, (
+            'a' * 32, 'A' * 40, '0' * 64, 'a' * 31, 'a' * 33, 'a' * 65,
+            'g' * 32, '',
+        )),
+        (Target.USER, verify_username, (
+            'astott', 'a.stott', 'a' * 105, 'a@b', 'domain\\user', 'a b',
+            'a,b', 'a*', '',
+        )),
+    )
+
+    def test_same_verdicts(self):
+        for target_type, verify, targets in self.SAMPLES:
+            verdicts = validate_targets(list(targets), target_type)
+            for target, verdict in zip(targets, verdicts):
+                try:
+                    verify(target)
+                    expected = None
+                except serializers.ValidationError as err:
+                    expected = err.detail
+                self.assertEqual(
+                    verdict, expected, '%s %r' % (target_type, target))
+
+
+class PluginCatalogTests(AuthenticatedTestCase):
+    """Catalogs of plugin methods built from plugins.ini."""
+    def setUp(self):
+        super(PluginCatalogTests, self).setUp()
+        handle, self.path = tempfile.mkstemp(suffix='.ini')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.patch(config.CONFIG, 'path', self.path)
+        self.patch(interfaces, 'CATALOGS', {})
+
+    def write_config(self, weight):
+        """Write plugins.ini with a weight for the EBL method."""
+        with open(self.path, 'w') as fil:
+            fil.write('[plugin_method_weights]\n%s = %s\n' % (
+                EBL_METHOD, weight))
+
+    def get_weight(self, catalog):
+        """Get the weight of the EBL method in a catalog."""
+        for methods in catalog['plugins'].values():
+            for method in methods:
+                if method['method'] == EBL_METHOD:
+                    return method['weight']
+
+    def test_catalog_is_built_once_per_config(self):
+        self.write_config(5)
+        catalog = interfaces.get_catalog(Target.IPADDR)
+        self.assertEqual(self.get_weight(catalog), 5)
+        self.assertIs(interfaces.get_catalog(Target.IPADDR), catalog)
+        self.write_config(10)
+        catalog = interfaces.get_catalog(Target.IPADDR)
+        self.assertEqual(self.get_weight(catalog), 10)
+
+    def test_bad_weight_does_not_stop_loading(self):
+        self.write_config('heavy')
+        interfaces.load_catalogs()
+        self.assertEqual(interfaces.CATALOGS, {})
+        with self.assertRaises(ValueError):
+            interfaces.get_catalog(Target.IPADDR)
+
+
+class PluginConfigTests(TestCase):
+    """The shared, reloadable plugins.ini."""
+    def setUp(self):
+        handle, path = tempfile.mkstemp(suffix='.ini')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        self.config = config.PluginConfig(path)
+
+    def write_config(self, text):
+        """Replace the contents of plugins.ini."""
+        with open(self.config.path, 'w') as fil:
+            fil.write(text)
+
+    def test_sections_follow_the_file(self):
+        self.write_config('[google]\ndomain = example.com\n')
+        version = self.config.version()
+        self.assertEqual(
+            self.config.section('google'), {'domain': 'example.com'})
+        self.assertIsNone(self.config.section('duo'))
+        self.write_config('[google]\ndomain = example.org\n[duo]\n')
+        self.assertNotEqual(self.config.version(), version)
+        self.assertEqual(
+            self.config.section('google'), {'domain': 'example.org'})
+        self.assertEqual(self.config.section('duo'), {})
+
+    def test_sections_are_copies(self):
+        self.write_config('[google]\ndomain = example.com\n')
+        self.config.section('google')['domain'] = 'changed'
+        self.assertEqual(
+            self.config.section('google'), {'domain': 'example.com'})
+
+    def test_missing_file(self):
+        self.config.path += '.missing'
+        self.assertIsNone(self.config.version())
+        self.assertIsNone(self.config.section('google'))
+
+
+class MultiMethodTests(APITransactionTestCase):
+    """A target added with many methods, run within the request."""
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('tester'))
+        self.calls = []
+        original = PaloAltoNetworks.add_to_ebl
+        self.addCleanup(setattr, PaloAltoNetworks, 'add_to_ebl', original)
+        PaloAltoNetworks.add_to_ebl = (
+            lambda plugin: self.calls.append(plugin.ipaddr))
+
+    def test_methods_run_within_the_request(self):
+        response = self.client.post('/api/v1/targets/methods/', {
+            'target': '198.51.100.8',
+            'target_type': Target.IPADDR,
+            'target_action': Target.BAN,
+            'reason': 'test',
+            'methods': [EBL_METHOD, 'paloaltonetworks_unknown'],
+        }, format='json')
+        results = json.loads(response.content)
+        self.assertEqual([item['status'] for item in results], [201, 400])
+        self.assertEqual(results[0]['job']['status'], PluginJob.SUCCEEDED)
+        self.assertEqual(results[1]['method'], 'paloaltonetworks_unknown')
+        self.assertEqual(self.calls, ['198.51.100.8'])
+
+
+    def test_waiting_methods_get_heartbeats(self):
+        for name, value in (('HEARTBEAT_INTERVAL', 0.05),
+                            ('get_method_weights', lambda: {'a': 1})):
+            self.addCleanup(setattr, jobs, name, getattr(jobs, name))
+            setattr(jobs, name, value)
+        first, waiting = jobs.enqueue_jobs([
+            create_target('198.51.100.10', method='a'),
+            create_target('198.51.100.11', method='b'),
+        ], PluginJob.RUNNING)
+        queued = PluginJob.objects.get(id=waiting.id).last_modified
+        touched = {}
+
+        def run_job(job):
+            if job.method == 'a':
+                # outlast a few heartbeats before the next weight runs
+                threading.Event().wait(0.3)
+            touched[job.method] = PluginJob.objects.get(
+                id=job.id).last_modified
+        self.addCleanup(setattr, jobs, 'run_job', jobs.run_job)
+        jobs.run_job = run_job
+        jobs.run_jobs_by_weight([first, waiting])
+        self.assertGreater(touched['b'], queued)
+
+
+class IpRangeLockTests(TransactionTestCase):
+    """Concurrent saves of overlapping IP ranges."""
+    def save_range(self, target, target_action, saved, errors):
+        """Save the range of a Target in its own transaction."""
+        try:
+            with transaction.atomic():
+                views.add_to_targetiprange_db(create_target(
+                    target, target_action=target_action))
+            saved.set()
+        except ValidationError as err:
+            errors.append(err)
+        finally:
+            connection.close()
+
+    def test_overlapping_save_waits_for_the_first(self):
+        saved, errors = threading.Event(), []
+        with transaction.atomic():
+            views.add_to_targetiprange_db(create_target('198.51.100.0/24'))
+            thread = threading.Thread(target=self.save_range, args=(
+                '198.51.100.5', Target.ALLOW, saved, errors))
+            thread.start()
+            # the second save can not check for overlaps until this commits
+            self.assertFalse(saved.wait(1))
+        thread.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(TargetIpRange.objects.count(), 1)
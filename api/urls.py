@@ -15,11 +15,31 @@ urlpatterns = [
         views.target_list_bytype,
         name='target_list_bytype',
     ),
+    url(
+        r'^targets/bulk/$',
+        views.target_list_bulk,
+        name='target_list_bulk',
+    ),
+    url(
+        r'^targets/methods/$',
+        views.target_list_methods,
+        name='target_list_methods',
+    ),
+    url(
+        r'^targets/datatables/$',
+        views.target_list_datatables,
+        name='target_list_datatables',
+    ),
     url(
         r'^targets/(?P<target_id>.+)$',
         views.target_detail,
         name='target_detail',
     ),
+    url(
+        r'^jobs/(?P<job_id>\d+)$',
+        views.job_detail,
+        name='job_detail',
+    ),
     url(
         r'^plugins/(?P<target_type>(ip|domain|url|hash|user))/$',
         views.plugin_dict_bytype,
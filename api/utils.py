@@ -0,0 +1,60 @@
+"""Miscellaneous utility functions shared by the API."""
+import bisect
+import socket
+import struct
+
+import netaddr
+
+
+def ip_target_bounds(target):
+    """Get the first and last IP address of an IP Target as integers."""
+    if '-' in target:
+        iprange = target.split('-')
+        return (netaddr.IPAddress(iprange[0]).value,
+                netaddr.IPAddress(iprange[1]).value)
+    if '/' in target:
+        ipnet = netaddr.IPNetwork(target)
+        return ipnet.first, ipnet.last
+    ipaddr = netaddr.IPAddress(target).value
+    return ipaddr, ipaddr
+
+
+def int_to_ipaddr(value):
+    """Convert an integer to an IPv4 address string."""
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def merge_ip_ranges(ranges):
+    """Merge (first, last) ranges sorted by first into disjoint ranges."""
+    current = None
+    for first, last in ranges:
+        if current is None:
+            current = [first, last]
+        elif first <= current[1] + 1:
+            # overlapping or adjacent, so extend the current range
+            current[1] = max(current[1], last)
+        else:
+            yield tuple(current)
+            current = [first, last]
+    if current is not None:
+        yield tuple(current)
+
+
+def overlaps_ip_ranges(ranges, first, last):
+    """Check if (first, last) overlaps any of the sorted, disjoint ranges."""
+    # the only candidate is the last range starting at or before last
+    index = bisect.bisect_right(ranges, (last, float('inf')))
+    return index > 0 and ranges[index - 1][1] >= first
+
+
+def subtract_ip_ranges(first, last, ranges):
+    """Get the parts of (first, last) not in the sorted, disjoint ranges."""
+    for range_first, range_last in ranges:
+        if range_last < first or range_first > last:
+            continue
+        if range_first > first:
+            yield first, range_first - 1
+        first = range_last + 1
+        if first > last:
+            return
+    yield first, last
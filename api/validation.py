@@ -0,0 +1,115 @@
+"""Batch validation of Target formats."""
+import re
+
+from rest_framework import serializers
+
+from api.models import Target
+from api.serializers import (
+    NON_PUBLIC_IPV4_RANGES, REGEX_DOMAIN, REGEX_HASH, REGEX_URL,
+    USERNAME_INVALID_CHARS, verify_ip)
+from api.utils import overlaps_ip_ranges
+
+OCTET = r'(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
+IPV4 = r'\.'.join([OCTET] * 4)
+
+# the address, CIDR, and range formats accepted by verify_ip in one pattern
+REGEX_IPV4_TARGET = re.compile(
+    r'^%s(?:/((?:3[0-2])|(?:[1-2]\d)|[1-9])|-%s)?$' % (IPV4, IPV4))
+REGEX_USERNAME_INVALID = re.compile(
+    '[%s]' % re.escape(USERNAME_INVALID_CHARS))
+
+# netaddr parses octets with a leading zero differently for addresses and
+# networks, so those targets are left to the single target validators
+REGEX_LEADING_ZERO = re.compile(r'(?:^|[.\-/])0[0-9]')
+
+
+def error(message):
+    """Get the validation errors for a target."""
+    return {'target': [message]}
+
+
+def octets_to_int(octets):
+    """Convert four octet strings to an integer IP address."""
+    return ((int(octets[0]) << 24) | (int(octets[1]) << 16) |
+            (int(octets[2]) << 8) | int(octets[3]))
+
+
+def validate_ip(target):
+    """Validate an IP target, returning its errors if any."""
+    match = REGEX_IPV4_TARGET.match(target)
+    if not match:
+        return error('Invalid IP format.')
+    if REGEX_LEADING_ZERO.search(target):
+        try:
+            verify_ip(target)
+        except serializers.ValidationError as err:
+            return err.detail
+        return None
+    groups = match.groups()
+    first = octets_to_int(groups[0:4])
+    if groups[4] is not None:
+        # CIDR, which is rejected only if it lies within a non-public block
+        prefix = int(groups[4])
+        if prefix < 16:
+            return error('IP ranges are limited to a /16.')
+        first &= (0xffffffff << (32 - prefix)) & 0xffffffff
+        last = first | (0xffffffff >> prefix)
+        if any(block_first <= first and last <= block_last
+               for block_first, block_last in NON_PUBLIC_IPV4_RANGES):
+            return error('Only public IP addresses can be added.')
+        return None
+    last = first
+    if groups[5] is not None:
+        last = octets_to_int(groups[5:9])
+        if first > last:
+            return error('Invalid IP range notation.')
+        if last - first + 1 > 65536:
+            return error('IP ranges are limited to a /16.')
+    if overlaps_ip_ranges(NON_PUBLIC_IPV4_RANGES, first, last):
+        return error('Only public IP addresses can be added.')
+    return None
+
+
+def validate_domain(target):
+    """Validate a domain target, returning its errors if any."""
+    if not REGEX_DOMAIN.match(target):
+        return error('Invalid domain format.')
+    return None
+
+
+def validate_url(target):
+    """Validate a URL target, returning its errors if any."""
+    if not REGEX_URL.match(target):
+        return error('Invalid URL format.')
+    return None
+
+
+def validate_hash(target):
+    """Validate a hash target, returning its errors if any."""
+    if not REGEX_HASH.match(target):
+        return error('Invalid hash format.')
+    return None
+
+
+def validate_username(target):
+    """Validate a username target, returning its errors if any."""
+    if REGEX_USERNAME_INVALID.search(target):
+        return error(
+            'Username cannot contain the following characters: %s' % (
+                USERNAME_INVALID_CHARS))
+    return None
+
+
+VALIDATORS = {
+    Target.IPADDR: validate_ip,
+    Target.DOMAIN: validate_domain,
+    Target.URL: validate_url,
+    Target.HASH: validate_hash,
+    Target.USER: validate_username,
+}
+
+
+def validate_targets(targets, target_type):
+    """Validate a list of targets of one type, returning errors or None."""
+    validate = VALIDATORS[target_type]
+    return [validate(target) for target in targets]
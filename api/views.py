@@ -1,23 +1,51 @@
 """API Django views."""
+import json
 import logging
 
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Permission
 from django.core.exceptions import ValidationError
-from django.db import transaction
-from django.http import HttpResponse
-import netaddr
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import etag
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.renderers import JSONRenderer
 
-from api.models import Target, TargetIpAddr
-from api.serializers import TargetSerializer
-from plugins.interfaces import TargetInterface
+from api.changes import record_addition, record_removal
+from api.counters import add_to_count
+from api.datatables import (
+    get_int_param, order_targets, page_targets, search_targets)
+from api.jobs import enqueue_jobs, run_jobs_by_weight
+from api.models import PluginJob, Target, TargetIpRange
+from api.pagination import get_limit, paginate_targets
+from api.serializers import (
+    PluginJobSerializer, TargetSerializer, whitelisted_in_batch,
+    whitelisted_targets)
+from api.streaming import stream_targets
+from api.utils import ip_target_bounds
+from api.validation import VALIDATORS, validate_targets
+from plugins.interfaces import TargetInterface, get_catalog
 from banhammer.settings import GROUP_PERMISSIONS_ENABLED as group_perms_enabled
 
 # get api logger
 LOGGER = logging.getLogger(__name__)
 
+ALL_PERMISSIONS = frozenset(['target_all_read', 'target_all_write'])
+BULK_BATCH_SIZE = 500
+
+# arbitrary key of the advisory lock serializing writes to TargetIpRange
+IP_RANGE_LOCK = 0x495052
+
+# permission required to read each Target type
+READ_PERMISSIONS = (
+    (Target.IPADDR, 'target_ipaddr_read'),
+    (Target.DOMAIN, 'target_domain_read'),
+    (Target.URL, 'target_url_read'),
+    (Target.HASH, 'target_hash_read'),
+    (Target.USER, 'target_user_read'),
+)
+
 
 class JSONResponse(HttpResponse):
     """Override JSONResponse to indent responses."""
@@ -30,11 +58,15 @@ class JSONResponse(HttpResponse):
 def get_user_permissions(user):
     """Get all permissions associated to user's groups."""
     if not group_perms_enabled:
-        return ['target_all_read', 'target_all_write']
-    groups = Group.objects.filter(user=user)
-    permissions = []
-    for grp in groups:
-        permissions += [x.codename for x in grp.permissions.all()]
+        return ALL_PERMISSIONS
+    # request.user lives for one request, so memoize the result on it; it
+    # is not cached across requests, since each process would keep its own
+    # copy after the user's groups change
+    permissions = getattr(user, '_group_permissions', None)
+    if permissions is None:
+        permissions = frozenset(Permission.objects.filter(
+            group__user=user).values_list('codename', flat=True))
+        user._group_permissions = permissions
     return permissions
 
 
@@ -44,18 +76,11 @@ def get_all_targets(user):
     if 'target_all_read' in permissions:
         return Target.objects.all()
 
-    targets = Target.objects.none()
-    if 'target_ipaddr_read' in permissions:
-        targets = targets | Target.objects.filter(target_type=Target.IPADDR)
-    if 'target_domain_read' in permissions:
-        targets = targets | Target.objects.filter(target_type=Target.DOMAIN)
-    if 'target_url_read' in permissions:
-        targets = targets | Target.objects.filter(target_type=Target.URL)
-    if 'target_hash_read' in permissions:
-        targets = targets | Target.objects.filter(target_type=Target.HASH)
-    if 'target_user_read' in permissions:
-        targets = targets | Target.objects.filter(target_type=Target.USER)
-    return targets
+    target_types = [
+        target_type for target_type, permission in READ_PERMISSIONS
+        if permission in permissions
+    ]
+    return Target.objects.filter(target_type__in=target_types)
 
 
 def permission_to_write(user, target_type):
@@ -96,61 +121,118 @@ def permission_to_read(user, target_type):
     return allow
 
 
-def add_block(valid_data):
-    """Perform blocking actions after adding to database."""
-    if valid_data['target_action'] == Target.BAN:
-        target = TargetInterface(
-            valid_data['target'],
-            valid_data['target_type'],
-            valid_data['reason'],
-        )
-        target.run_method(valid_data['method'])
+def lock_ip_ranges():
+    """Hold the TargetIpRange lock until the current transaction ends."""
+    # the overlap check and insert would race under READ COMMITTED, letting
+    # two overlapping ranges for different actions both be saved
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [IP_RANGE_LOCK])
 
 
-def add_to_targetipaddr_db(instance):
-    """Adds IP addresses as individual entries in TargetIpAddr database."""
+def add_to_targetiprange_db(instance):
+    """Adds the IP address range of a Target to TargetIpRange database."""
     if instance.target_type == Target.IPADDR:
-        if '-' in instance.target:
-            iprange = instance.target.split('-')
-            iplist = list(netaddr.iter_iprange(iprange[0], iprange[1]))
-        elif '/' in instance.target:
-            iplist = list(netaddr.IPNetwork(instance.target))
-        else:
-            iplist = [instance.target]
-        for ipaddr in iplist:
-            try:
-                # grab pre-existing entry
-                ip_entry = TargetIpAddr.objects.get(
-                    ipaddr=ipaddr,
-                )
-                if ip_entry.ipaddr_action != instance.target_action:
-                    raise ValidationError({
-                        'target': [
-                            'Target "%s" is already marked for action "%s"' % (
-                                ip_entry.ipaddr, ip_entry.ipaddr_action)
-                        ]
-                    })
-            except TargetIpAddr.DoesNotExist:
-                # create new entry
-                ip_entry = TargetIpAddr(
-                    ipaddr=ipaddr,
-                    ipaddr_action=instance.target_action,
-                    method=instance.method,
-                )
-                ip_entry.save()
-            # associate IP address to target
-            ip_entry.target.add(instance)
+        lock_ip_ranges()
+        first, last = ip_target_bounds(instance.target)
+        # look for an overlapping range marked for another action
+        other_actions = [
+            action for action, _ in Target.TARGET_ACTION_CHOICES
+            if action != instance.target_action]
+        conflict = TargetIpRange.objects.filter(
+            ipaddr_action__in=other_actions,
+        ).overlapping(first, last).select_related('target').first()
+        if conflict:
+            raise ValidationError({
+                'target': [
+                    'Target "%s" is already marked for action "%s"' % (
+                        conflict.target.target, conflict.ipaddr_action)
+                ]
+            })
+        TargetIpRange.objects.create(
+            first_ipaddr=first,
+            last_ipaddr=last,
+            ipaddr_action=instance.target_action,
+            target=instance,
+            method=instance.method,
+        )
 
 
 @transaction.atomic
 def save_target(serializer):
-    """Save Target."""
-    # pre-save: Perform blocking actions
-    add_block(serializer.validated_data)
+    """Save Target, returning the id of its plugin job if any."""
     # save: create instance in Target database
     instance = serializer.save()
-    # post-save: Add IP address entries to database
-    add_to_targetipaddr_db(instance)
+    # post-save: Add IP address range to database
+    add_to_targetiprange_db(instance)
+    # post-save: Log entries added to the external block lists
+    record_addition(instance)
+    # post-save: Queue blocking actions, which workers run once committed
+    jobs = enqueue_jobs([instance])
+    return jobs[0].id if jobs else None
+
+
+@transaction.atomic
+def bulk_save_targets(batch, job_status=PluginJob.PENDING):
+    """Save a batch of (index, serializer) pairs in one transaction."""
+    results = []
+    created = [
+        (index, serializer, Target(**serializer.validated_data))
+        for index, serializer in batch
+    ]
+    # pre-save: Count the new instances, since bulk_create skips pre_save
+    groups = {}
+    for index, serializer, instance in created:
+        groups.setdefault(
+            (instance.target_type, instance.target_action), []).append(
+                (index, serializer, instance))
+    created = []
+    # lock the counters in a fixed order, so concurrent batches can't deadlock
+    for (target_type, target_action), group in sorted(groups.items()):
+        try:
+            add_to_count(target_type, target_action, len(group))
+        except ValidationError as err:
+            for index, _, _ in group:
+                results.append((index, {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': err.message_dict}))
+            continue
+        created.extend(group)
+    # save: create all instances in Target database at once
+    Target.objects.bulk_create([item[2] for item in created])
+    saved = []
+    if any(item[2].target_type == Target.IPADDR for item in created):
+        # take the lock before the change log lock, as single saves do
+        lock_ip_ranges()
+    for index, serializer, instance in created:
+        # post-save: Add IP address range to database
+        try:
+            with transaction.atomic():
+                add_to_targetiprange_db(instance)
+        except ValidationError as err:
+            instance.delete()
+            results.append((index, {
+                'status': status.HTTP_400_BAD_REQUEST,
+                'errors': err.message_dict}))
+            continue
+        # post-save: Log entries added to the external block lists
+        record_addition(instance)
+        # bulk_create does not send post_save, so send it for each Target
+        post_save.send(
+            sender=Target, instance=instance, created=True, raw=False,
+            using=instance._state.db, update_fields=None)
+        saved.append((index, serializer, instance))
+    # post-save: Queue blocking actions, which workers run once committed
+    jobs = dict(
+        (job.target_id, job.id)
+        for job in enqueue_jobs(
+            [item[2] for item in saved], job_status))
+    for index, serializer, instance in saved:
+        serializer.instance = instance
+        results.append((index, {
+            'status': status.HTTP_201_CREATED,
+            'target': serializer.data,
+            'job': jobs.get(instance.id)}))
+    return results
 
 
 def remove_block(instance):
@@ -166,16 +248,6 @@ def remove_block(instance):
         pass
 
 
-def delete_from_targetipaddr_db(instance):
-    """Remove IP addresses from TargetIpAddr database."""
-    if instance.target_type == Target.IPADDR:
-        ip_addrs = instance.targetipaddr_set.all()
-        for ip_addr in ip_addrs:
-            # remove IP address if this Target is its only reference
-            if ip_addr.target.count() == 1:
-                ip_addr.delete()
-
-
 def log_deletion(user, instance):
     """Log targets deleted from database."""
     msg = (
@@ -192,19 +264,60 @@ def delete_target(user, instance):
     """Delete Target."""
     # pre-delete: Perform unblocking actions
     remove_block(instance)
-    # pre-delete: Delete referenced IP's from TargetIpAddr database
-    delete_from_targetipaddr_db(instance)
-    # delete: remove instance from Target database
+    # delete: remove instance from Target database, which also deletes
+    # its IP address range from TargetIpRange database in one statement
     instance.delete()
+    # post-delete: Log entries removed from the external block lists
+    record_removal(instance)
     # post-delete: Log targets removed from database
     log_deletion(user, instance)
 
 
+def paginated_response(request, targets):
+    """Respond with one page of targets and a cursor to the next page."""
+    try:
+        limit = get_limit(request.query_params.get('limit'))
+    except ValueError:
+        return JSONResponse(
+            {'limit': ['Limit must be a positive integer.']},
+            status=status.HTTP_400_BAD_REQUEST)
+    try:
+        page, next_cursor = paginate_targets(
+            targets, limit, request.query_params.get('cursor'))
+    except ValueError:
+        return JSONResponse(
+            {'cursor': ['Invalid cursor.']},
+            status=status.HTTP_400_BAD_REQUEST)
+    serializer = TargetSerializer(page, many=True)
+    return JSONResponse({'results': serializer.data, 'next': next_cursor})
+
+
+def is_paginated(request):
+    """Returns True if the client asked for a paginated listing."""
+    return ('limit' in request.query_params or
+            'cursor' in request.query_params)
+
+
+def is_streamed(request):
+    """Returns True if the client asked for a streamed listing."""
+    return request.query_params.get('stream', '').lower() in ('1', 'true')
+
+
+def streaming_response(targets):
+    """Respond with all targets, encoded incrementally."""
+    return StreamingHttpResponse(
+        stream_targets(targets), content_type='application/json')
+
+
 @api_view(['GET', 'POST'])
 def target_list(request):
     """List all targets or add a target."""
     if request.method == 'GET':
         targets = get_all_targets(request.user)
+        if is_streamed(request):
+            return streaming_response(targets)
+        if is_paginated(request):
+            return paginated_response(request, targets)
         serializer = TargetSerializer(targets, many=True)
         request.accepted_media_type = 'application/json; indent=4'
         return JSONResponse(serializer.data)
@@ -220,15 +333,161 @@ def target_list(request):
             data=request.data, context={'request': request})
         if serializer.is_valid():
             try:
-                save_target(serializer)
+                job = save_target(serializer)
             except ValidationError as err:
                 return JSONResponse(err, status=status.HTTP_400_BAD_REQUEST)
-            return JSONResponse(serializer.data,
-                                status=status.HTTP_201_CREATED)
+            data = dict(serializer.data, job=job)
+            return JSONResponse(data, status=status.HTTP_201_CREATED)
         return JSONResponse(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
 
 
+def parse_bulk_data(request):
+    """Get a list of targets from a JSON array or NDJSON request."""
+    if request.content_type.startswith('application/x-ndjson'):
+        return [json.loads(line) for line in request.body.splitlines()
+                if line.strip()]
+    if not isinstance(request.data, list):
+        raise ValueError('Expected a list of targets.')
+    return request.data
+
+
+def validate_bulk_targets(items):
+    """Validate the format of a batch of targets, grouped by type."""
+    targets = {}
+    for item in items:
+        if (isinstance(item, dict) and
+                isinstance(item.get('target'), basestring) and
+                item.get('target_type') in VALIDATORS):
+            targets.setdefault(item['target_type'], set()).add(item['target'])
+    verdicts = {}
+    for target_type, group in targets.items():
+        group = list(group)
+        verdicts.update(zip(
+            [(target, target_type) for target in group],
+            validate_targets(group, target_type)))
+    return verdicts
+
+
+def validate_bulk_batch(request, batch):
+    """Validate a batch of (index, item) pairs, sharing one whitelist query."""
+    results = []
+    valid = []
+    allowed = whitelisted_targets([
+        (item.get('target'), item.get('target_type'),
+         item.get('target_action'))
+        for _, item in batch if isinstance(item, dict)])
+    verdicts = validate_bulk_targets([item for _, item in batch])
+    for index, item in batch:
+        if not isinstance(item, dict):
+            results.append((index, {
+                'status': status.HTTP_400_BAD_REQUEST,
+                'errors': {'non_field_errors': ['Invalid data.']}}))
+            continue
+        # check user write permissions
+        if not permission_to_write(request.user, item.get('target_type')):
+            results.append((index, {
+                'status': status.HTTP_403_FORBIDDEN,
+                'errors': {'target_type': ['Insufficiant permissions.']}}))
+            continue
+        # serialize data
+        serializer = TargetSerializer(
+            data=item, context={
+                'request': request,
+                'whitelisted': allowed,
+                'verdicts': verdicts,
+            })
+        if serializer.is_valid():
+            valid.append((index, serializer))
+        else:
+            results.append((index, {
+                'status': status.HTTP_400_BAD_REQUEST,
+                'errors': serializer.errors}))
+    # bans are also checked against the allows of the same batch
+    allowed = whitelisted_in_batch([
+        (checked.validated_data['target'],
+         checked.validated_data['target_type'],
+         checked.validated_data['target_action'])
+        for _, checked in valid])
+    if allowed:
+        batch, valid = valid, []
+        for index, serializer in batch:
+            data = serializer.validated_data
+            if (data['target'], data['target_type'],
+                    data['target_action']) in allowed:
+                results.append((index, {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': {'target': [
+                        'Target is whitelisted and cannot be banned.']}}))
+            else:
+                valid.append((index, serializer))
+    return results, valid
+
+
+@api_view(['POST'])
+def target_list_bulk(request):
+    """Add many targets at once."""
+    if request.method == 'POST':
+        try:
+            items = parse_bulk_data(request)
+        except ValueError:
+            return JSONResponse(
+                {'targets': ['Expected a JSON array or NDJSON of targets.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        results = [None] * len(items)
+        for start in range(0, len(items), BULK_BATCH_SIZE):
+            batch = list(enumerate(
+                items[start:start + BULK_BATCH_SIZE], start))
+            invalid, valid = validate_bulk_batch(request, batch)
+            for index, result in invalid + bulk_save_targets(valid):
+                results[index] = result
+        return JSONResponse(results)
+
+
+def parse_methods_data(request):
+    """Get one target per method from a target with a list of methods."""
+    data = request.data
+    if hasattr(data, 'getlist'):
+        methods = data.getlist('methods')
+        data = data.dict()
+    elif isinstance(data, dict):
+        methods = data.get('methods')
+        data = dict(data)
+    else:
+        raise ValueError('Expected a target.')
+    if not isinstance(methods, list) or not methods:
+        raise ValueError('Expected a list of methods.')
+    data.pop('methods', None)
+    data.pop('csrfmiddlewaretoken', None)
+    return [dict(data, method=method) for method in methods]
+
+
+@api_view(['POST'])
+def target_list_methods(request):
+    """Add a target with many methods, running the methods by weight."""
+    if request.method == 'POST':
+        try:
+            items = parse_methods_data(request)
+        except ValueError:
+            return JSONResponse(
+                {'methods': ['Expected a target with a list of methods.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        results = [None] * len(items)
+        invalid, valid = validate_bulk_batch(request, list(enumerate(items)))
+        # the jobs are claimed up front, since this request runs them itself
+        for index, result in invalid + bulk_save_targets(
+                valid, PluginJob.RUNNING):
+            results[index] = dict(result, method=items[index]['method'])
+        jobs = run_jobs_by_weight(list(PluginJob.objects.filter(
+            id__in=[item['job'] for item in results
+                    if item.get('job')]).select_related('target')))
+        jobs = dict((job.id, job) for job in jobs)
+        for result in results:
+            if result.get('job'):
+                result['job'] = PluginJobSerializer(jobs[result['job']]).data
+        return JSONResponse(results)
+
+
 @api_view(['GET'])
 def target_list_bytype(request, target_type):
     """List all targets by type."""
@@ -239,10 +498,35 @@ def target_list_bytype(request, target_type):
                 {'target_type': ['Insufficiant permissions.']},
                 status=status.HTTP_403_FORBIDDEN)
         targets = Target.objects.filter(target_type=target_type)
+        if is_streamed(request):
+            return streaming_response(targets)
+        if is_paginated(request):
+            return paginated_response(request, targets)
         serializer = TargetSerializer(targets, many=True)
         return JSONResponse(serializer.data)
 
 
+@api_view(['GET'])
+def target_list_datatables(request):
+    """List one page of targets for DataTables server-side processing."""
+    if request.method == 'GET':
+        params = request.query_params
+        targets = get_all_targets(request.user)
+        filtered = search_targets(targets, params)
+        page = page_targets(order_targets(filtered, params), params)
+        serializer = TargetSerializer(page, many=True)
+        records_total = targets.count()
+        records_filtered = records_total
+        if filtered is not targets:
+            records_filtered = filtered.count()
+        return JSONResponse({
+            'draw': get_int_param(params, 'draw', 0),
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': serializer.data,
+        })
+
+
 @api_view(['GET', 'DELETE'])
 def target_detail(request, target_id):
     """Retrieve a target."""
@@ -271,6 +555,31 @@ def target_detail(request, target_id):
 
 
 @api_view(['GET'])
+def job_detail(request, job_id):
+    """Retrieve the status of a plugin job."""
+    try:
+        job = PluginJob.objects.select_related('target').get(id=job_id)
+    except PluginJob.DoesNotExist:
+        return JSONResponse(status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        # check user read permissions
+        if not permission_to_read(request.user, job.target.target_type):
+            return JSONResponse(status=status.HTTP_404_NOT_FOUND)
+        serializer = PluginJobSerializer(job)
+        return JSONResponse(serializer.data)
+
+
+def plugin_catalog_etag(request, target_type):
+    """Get the ETag of the plugin catalog for a target type."""
+    # only readers of the target type may revalidate its catalog
+    if not permission_to_read(request.user, target_type):
+        return None
+    return get_catalog(target_type)['etag']
+
+
+@api_view(['GET'])
+@etag(plugin_catalog_etag)
 def plugin_dict_bytype(request, target_type):
     """Get dictionary of plugins by type."""
     if request.method == 'GET':
@@ -284,6 +593,7 @@ def plugin_dict_bytype(request, target_type):
 
 
 @api_view(['GET'])
+@etag(plugin_catalog_etag)
 def method_list_bytype(request, target_type):
     """Get list of methods by type."""
     if request.method == 'GET':
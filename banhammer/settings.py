@@ -215,6 +215,13 @@ STATIC_URL = '/static/'
 STATIC_ROOT = config.get('django', 'web_static_root')
 
 
+# Precomputed external block lists
+if config.has_option('ebl', 'snapshot_dir'):
+    EBL_SNAPSHOT_DIR = config.get('ebl', 'snapshot_dir')
+else:
+    EBL_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'ebl_snapshots')
+
+
 # Logging configuration
 # https://docs.djangoproject.com/ja/1.9/topics/logging/
 LOGGING = {
@@ -239,5 +246,15 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'plugins': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'ebl': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 }
@@ -7,3 +7,6 @@ from django.apps import AppConfig
 class EblConfig(AppConfig):
     """BanHammer EBL Django app."""
     name = 'ebl'
+
+    def ready(self):
+        import ebl.signals
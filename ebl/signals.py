@@ -0,0 +1,21 @@
+"""EBL Django signals."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.changes import on_ebl
+from api.models import Target
+from ebl.snapshots import schedule_refresh
+
+
+@receiver(post_save, sender=Target)
+def refresh_on_save(sender, instance, **kwargs):
+    """Flag the EBL snapshots changed by a saved target."""
+    if on_ebl(instance):
+        schedule_refresh(instance.target_type)
+
+
+@receiver(post_delete, sender=Target)
+def refresh_on_delete(sender, instance, **kwargs):
+    """Flag the EBL snapshots changed by a deleted target."""
+    if on_ebl(instance):
+        schedule_refresh(instance.target_type)
@@ -0,0 +1,260 @@
+"""Precomputed external block list snapshots."""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from api.models import EblChange, Target
+from ebl.streaming import iter_cidr_ebl, iter_ipaddr_ebl, iter_target_ebl
+
+# get ebl logger
+LOGGER = logging.getLogger(__name__)
+
+IPADDR_AGGREGATE = 'ip-aggregate'
+
+# arbitrary key of the advisory locks serializing snapshot regeneration
+EBL_SNAPSHOT_LOCK = 0x45424d
+
+# snapshots regenerated when targets of each type change
+EBL_SNAPSHOTS = {
+    Target.IPADDR: (Target.IPADDR, IPADDR_AGGREGATE),
+    Target.DOMAIN: (Target.DOMAIN,),
+    Target.URL: (Target.URL,),
+}
+
+# snapshots changed by the current transaction of each thread
+PENDING = threading.local()
+# seconds between checks for changed snapshots to regenerate
+REFRESH_INTERVAL = 1
+
+
+def snapshot_type(name):
+    """Get the target type of a snapshot."""
+    for target_type, names in EBL_SNAPSHOTS.items():
+        if name in names:
+            return target_type
+
+
+def latest_change(name):
+    """Get the id of the latest change included in a snapshot."""
+    return EblChange.objects.filter(
+        target_type=snapshot_type(name)).aggregate(
+            cursor=Max('id'))['cursor'] or 0
+
+
+def generate_ebl(name):
+    """Generate the lines of an EBL snapshot."""
+    if name == Target.IPADDR:
+        return iter_ipaddr_ebl()
+    if name == IPADDR_AGGREGATE:
+        return iter_cidr_ebl()
+    return iter_target_ebl(name)
+
+
+def snapshot_path(name, version=None, gzipped=False):
+    """Get the path of a snapshot version, or of its metadata."""
+    if version is None:
+        filename = '%s.json' % name
+
+    else:
+        filename = '%s.%s.txt' % (name, version)
+        if gzipped:
+            filename += '.gz'
+    return os.path.join(settings.EBL_SNAPSHOT_DIR, filename)
+
+
+def changed_path(name):
+    """Get the path of the flag of a snapshot waiting to be regenerated."""
+    return os.path.join(settings.EBL_SNAPSHOT_DIR, '%s.changed' % name)
+
+
+def read_meta(name):
+    """Read the metadata of the current version of a snapshot."""
+    try:
+        with open(snapshot_path(name)) as meta_file:
+            return json.load(meta_file)
+    except (IOError, ValueError):
+        return None
+
+
+def lock_snapshot(name):
+    """Hold the regeneration lock of a snapshot until the transaction ends."""
+    # a writer that read older targets must not rename its files last, so
+    # writers take turns, each reading the targets once it holds the lock
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, %s)',
+            [EBL_SNAPSHOT_LOCK, zlib.crc32(name) & 0x7fffffff])
+
+
+def write_snapshot(name):
+    """Regenerate a snapshot and return its metadata."""
+    with transaction.atomic():
+        lock_snapshot(name)
+        return write_snapshot_files(name)
+
+
+def make_snapshot_dir():
+    """Create the snapshot directory if it does not exist."""
+    if not os.path.isdir(settings.EBL_SNAPSHOT_DIR):
+        os.makedirs(settings.EBL_SNAPSHOT_DIR)
+
+
+def write_snapshot_files(name):
+    """Write the files of a snapshot and return its metadata."""
+    make_snapshot_dir()
+    # write to temporary files and rename them, so readers never see a
+    # partial snapshot
+    paths = []
+    for suffix in ('.txt', '.txt.gz', '.json'):
+        handle, path = tempfile.mkstemp(
+            suffix=suffix, dir=settings.EBL_SNAPSHOT_DIR)
+        os.close(handle)
+        os.chmod(path, 0o644)
+        paths.append(path)
+    text_path, gzip_path, meta_path = paths
+    try:
+        # changes after the cursor may be in the snapshot too, but
+        # replaying them is harmless
+        cursor = latest_change(name)
+        digest = hashlib.sha1()
+        with open(text_path, 'wb') as text_file, \
+                open(gzip_path, 'wb') as raw_file:
+            gzip_file = gzip.GzipFile(
+                filename='', mode='wb', fileobj=raw_file, mtime=0)
+            for chunk in generate_ebl(name):
+                text_file.write(chunk)
+                gzip_file.write(chunk)
+                digest.update(chunk)
+            gzip_file.close()
+        meta = {
+            'version': digest.hexdigest(),
+            'last_modified': time.time(),
+            'cursor': cursor,
+        }
+        previous = read_meta(name)
+        if previous and previous['version'] == meta['version']:
+            # nothing changed, so keep the validators clients already have
+            meta['last_modified'] = previous['last_modified']
+        with open(meta_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.rename(text_path, snapshot_path(name, meta['version']))
+        os.rename(gzip_path, snapshot_path(name, meta['version'], True))
+        os.rename(meta_path, snapshot_path(name))
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    remove_old_snapshots(name, meta['version'])
+    return meta
+
+
+def remove_old_snapshots(name, version):
+    """Remove all versions of a snapshot but the current and previous."""
+    current = snapshot_path(name, version)
+    paths = [
+        path for path in glob.glob(snapshot_path(name, '*'))
+        if path != current
+    ]
+    # readers may still be opening the previous version
+    try:
+        paths.sort(key=os.path.getmtime, reverse=True)
+    except OSError:
+        return
+    for path in paths[1:]:
+        for stale in (path, path + '.gz'):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def get_snapshot(name):
+    """Get the metadata of a snapshot, generating it if missing."""
+    return read_meta(name) or write_snapshot(name)
+
+
+def open_snapshot(name, meta, gzipped=False):
+    """Open a version of a snapshot, regenerating it if it is gone."""
+    try:
+        return open(snapshot_path(name, meta['version'], gzipped), 'rb'), meta
+    except IOError:
+        meta = write_snapshot(name)
+        return open(snapshot_path(name, meta['version'], gzipped), 'rb'), meta
+
+
+def mark_stale(name):
+    """Remove the metadata of a snapshot, so the next reader regenerates it."""
+    try:
+        os.remove(snapshot_path(name))
+    except OSError:
+        pass
+
+
+def flag_changed(name):
+    """Flag a snapshot to be regenerated, unless it has been already."""
+    pending = PENDING.__dict__.setdefault('names', set())
+    if name in pending:
+        pending.discard(name)
+        # the targets are already committed, so a failure here must not
+        # fail the request that changed them
+        try:
+            make_snapshot_dir()
+            open(changed_path(name), 'a').close()
+        except (IOError, OSError):
+            LOGGER.exception('snapshot="%s" could not be flagged', name)
+            mark_stale(name)
+
+
+def refresh_snapshot(name):
+    """Regenerate a snapshot if it is flagged as changed."""
+    try:
+        # clear the flag first, so a change committed while regenerating
+        # flags the snapshot again
+        os.remove(changed_path(name))
+    except OSError:
+        return
+    try:
+        write_snapshot(name)
+    except Exception:
+        LOGGER.exception('snapshot="%s" regeneration failed', name)
+        mark_stale(name)
+
+
+def refresh_snapshots(stop):
+    """Regenerate changed snapshots until the stop event is set."""
+    try:
+        while not stop.wait(REFRESH_INTERVAL):
+            for names in EBL_SNAPSHOTS.values():
+                for name in names:
+                    refresh_snapshot(name)
+    finally:
+        connection.close()
+
+
+def start_refresher(stop):
+    """Start a thread regenerating changed snapshots until stop is set."""
+    refresher = threading.Thread(
+        target=refresh_snapshots, args=(stop,), name='snapshot-refresher')
+    refresher.daemon = True
+    refresher.start()
+    return refresher
+
+
+def schedule_refresh(target_type):
+    """Flag the EBL snapshots of a type once the transaction commits."""
+    for name in EBL_SNAPSHOTS.get(target_type, ()):
+        # a bulk save changes many targets, but flags each snapshot once,
+        # and the snapshot refresher regenerates it outside the request
+        PENDING.__dict__.setdefault('names', set()).add(name)
+        transaction.on_commit(lambda name=name: flag_changed(name))
@@ -0,0 +1,68 @@
+"""Streaming generation of external block lists."""
+import netaddr
+
+from api.models import EBL_METHOD, Target, TargetIpRange
+from api.streaming import CHUNK_SIZE
+from api.utils import int_to_ipaddr, merge_ip_ranges
+
+
+def iter_ebl_ranges():
+    """Iterate over the disjoint (first, last) ranges of banned addresses."""
+    ip_ranges = TargetIpRange.objects.filter(
+        ipaddr_action=Target.BAN,
+        method=EBL_METHOD,
+    ).order_by('first_ipaddr').values_list(
+        'first_ipaddr', 'last_ipaddr').iterator()
+    # overlapping bans share addresses, so list each address once
+    return merge_ip_ranges(ip_ranges)
+
+
+def iter_chunks(lines, chunk_size):
+    """Join lines into chunks of chunk_size lines."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def iter_ipaddr_ebl(chunk_size=CHUNK_SIZE):
+    """Yield the banned IP addresses, chunk_size lines at a time."""
+    return iter_chunks((
+        int_to_ipaddr(ipaddr)
+        for first, last in iter_ebl_ranges()
+        for ipaddr in xrange(first, last + 1)
+    ), chunk_size)
+
+
+def iter_cidr_ebl(chunk_size=CHUNK_SIZE):
+    """Yield the banned IP addresses as the fewest CIDRs covering them."""
+    # the merged ranges are disjoint and not adjacent, so their CIDRs can
+    # not be merged any further
+    return iter_chunks((
+        str(cidr)
+        for first, last in iter_ebl_ranges()
+        for cidr in netaddr.iprange_to_cidrs(
+            int_to_ipaddr(first), int_to_ipaddr(last))
+    ), chunk_size)
+
+
+def iter_target_ebl(target_type, chunk_size=CHUNK_SIZE):
+    """Yield the banned targets of a type, chunk_size lines at a time."""
+    targets = Target.objects.filter(
+        target_action=Target.BAN,
+        target_type=target_type,
+        method=EBL_METHOD,
+    ).order_by('target').distinct('target').values_list('target', flat=True)
+    chunk = targets
+    while True:
+        # seek past the previous chunk, so only one chunk is held in memory
+        lines = list(chunk[:chunk_size])
+        if lines:
+            yield '\n'.join(lines) + '\n'
+        if len(lines) < chunk_size:
+            return
+        chunk = targets.filter(target__gt=lines[-1])
@@ -1,4 +1,269 @@
 """EBL tests."""
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from api.models import EBL_METHOD, EblChange, Target
+from api.views import add_to_targetiprange_db
+from ebl import snapshots, views
+from ebl.snapshots import (
+    changed_path, read_meta, refresh_snapshot, write_snapshot)
+from ebl.streaming import iter_cidr_ebl, iter_ipaddr_ebl, iter_target_ebl
+
+
+def create_ban(target, target_type, method=EBL_METHOD):
+    """Create a banned Target without running any plugin method."""
+    return Target.objects.create(
+        target=target,
+        target_type=target_type,
+        target_action=Target.BAN,
+        reason='test',
+        method=method,
+        user='test',
+    )
+
+
+def create_ip_ban(target, method=EBL_METHOD, target_action=Target.BAN):
+    """Create an IP Target and its address range."""
+    instance = Target.objects.create(
+        target=target,
+        target_type=Target.IPADDR,
+        target_action=target_action,
+        reason='test',
+        method=method,
+        user='test',
+    )
+    add_to_targetiprange_db(instance)
+    return instance
+
+
+class StreamingTests(TestCase):
+    """Lines of the EBLs, generated a chunk at a time."""
+    def test_ip_ranges_are_listed_by_address_once(self):
+        create_ip_ban('198.51.100.2-198.51.100.4')
+        create_ip_ban('198.51.100.1/30')
+        create_ip_ban('198.51.100.9')
+        create_ip_ban('198.51.100.200', target_action=Target.ALLOW)
+        chunks = list(iter_ipaddr_ebl(chunk_size=2))
+        self.assertEqual(chunks, [
+            '198.51.100.0\n198.51.100.1\n',
+            '198.51.100.2\n198.51.100.3\n',
+            '198.51.100.4\n198.51.100.9\n',
+        ])
+
+    def test_targets_are_listed_once_in_order(self):
+        for target in ('c.com', 'a.com', 'b.com', 'a.com'):
+            create_ban(target, Target.DOMAIN)
+        create_ban('evil.com/x', Target.URL)
+        self.assertEqual(
+            list(iter_target_ebl(Target.DOMAIN, chunk_size=2)),
+            ['a.com\nb.com\n', 'c.com\n'])
+        self.assertEqual(list(iter_target_ebl(Target.HASH)), [])
+
+    def test_ip_ranges_are_aggregated_into_cidrs(self):
+        create_ip_ban('198.51.100.0-198.51.100.2')
+        create_ip_ban('198.51.100.3-198.51.100.10')
+        create_ip_ban('198.51.100.12')
+        self.assertEqual(''.join(iter_cidr_ebl()), ''.join(
+            '%s\n' % cidr for cidr in (
+                '198.51.100.0/29', '198.51.100.8/31', '198.51.100.10/32',
+                '198.51.100.12/32')))
+
+    def test_only_the_ebl_method_is_listed(self):
+        create_ban('evil.com', Target.DOMAIN)
+        create_ban('other.com', Target.DOMAIN, method='other')
+        create_ban('prefix.com', Target.DOMAIN, method=EBL_METHOD + 's')
+        create_ip_ban('198.51.100.1')
+        create_ip_ban('198.51.100.2', method='other')
+        self.assertEqual(
+            ''.join(iter_target_ebl(Target.DOMAIN)), 'evil.com\n')
+        self.assertEqual(''.join(iter_ipaddr_ebl()), '198.51.100.1\n')
+
+
+class SnapshotDirMixin(object):
+    """Mixin for test cases writing EBL snapshots to a temporary directory."""
+    def setUp(self):
+        super(SnapshotDirMixin, self).setUp()
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.settings = override_settings(EBL_SNAPSHOT_DIR=self.snapshot_dir)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.snapshot_dir)
+        super(SnapshotDirMixin, self).tearDown()
+
+    def get_lines(self, target_type, **params):
+        """Get the lines of an EBL."""
+        response = self.client.get('/ebl/%s' % target_type, params)
+        return ''.join(response.streaming_content).split()
+
+
+class SnapshotTests(SnapshotDirMixin, TestCase):
+    """Precomputed EBL snapshots and conditional GET."""
+    def test_conditional_get(self):
+        create_ban('evil.com', Target.DOMAIN)
+        response = self.client.get('/ebl/domain')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(''.join(response.streaming_content), 'evil.com\n')
+        response = self.client.get(
+            '/ebl/domain', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_the_list(self):
+        create_ban('evil.com', Target.DOMAIN)
+        etag = self.client.get('/ebl/domain')['ETag']
+        create_ban('worse.com', Target.DOMAIN)
+        write_snapshot(Target.DOMAIN)
+        response = self.client.get('/ebl/domain', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unchanged_list_keeps_last_modified(self):
+        create_ban('evil.com', Target.DOMAIN)
+        meta = write_snapshot(Target.DOMAIN)
+        self.assertEqual(
+            write_snapshot(Target.DOMAIN)['last_modified'],
+            meta['last_modified'])
+
+    def test_failed_refresh_marks_snapshot_stale(self):
+        write_snapshot(Target.DOMAIN)
+
+        def generate_ebl(name):
+            raise IOError('No space left on device')
+        original, snapshots.generate_ebl = snapshots.generate_ebl, generate_ebl
+        try:
+            open(changed_path(Target.DOMAIN), 'a').close()
+            refresh_snapshot(Target.DOMAIN)
+        finally:
+            snapshots.generate_ebl = original
+        self.assertIsNone(read_meta(Target.DOMAIN))
+
+    def test_aggregate_mode(self):
+        create_ip_ban('198.51.100.0/30')
+        self.assertEqual(self.get_lines(Target.IPADDR), [
+            '198.51.100.0', '198.51.100.1', '198.51.100.2', '198.51.100.3'])
+        self.assertEqual(
+            self.get_lines(Target.IPADDR, aggregate='true'),
+            ['198.51.100.0/30'])
+
+
+class SnapshotRefreshTests(SnapshotDirMixin, TransactionTestCase):
+    """Snapshots regenerated outside of the requests changing them."""
+    def test_only_ebl_changes_flag_the_snapshot(self):
+        create_ban('other.com', Target.DOMAIN, method='other')
+        self.assertFalse(os.path.exists(changed_path(Target.DOMAIN)))
+        create_ban('evil.com', Target.DOMAIN)
+        self.assertTrue(os.path.exists(changed_path(Target.DOMAIN)))
+        self.assertFalse(os.path.exists(changed_path(Target.URL)))
+
+    def test_changed_snapshot_is_regenerated_by_the_refresher(self):
+        write_snapshot(Target.DOMAIN)
+        create_ban('evil.com', Target.DOMAIN)
+        # readers get the previous snapshot until it is regenerated
+        self.assertEqual(self.get_lines(Target.DOMAIN), [])
+        refresh_snapshot(Target.DOMAIN)
+        self.assertEqual(self.get_lines(Target.DOMAIN), ['evil.com'])
+        self.assertFalse(os.path.exists(changed_path(Target.DOMAIN)))
+
+
+class DeltaTests(SnapshotDirMixin, APITestCase):
+    """Changes to EBLs since a cursor."""
+    def setUp(self):
+        super(DeltaTests, self).setUp()
+        self.client.force_authenticate(User.objects.create_user('tester'))
+        self.cursor = 0
+
+    def ban(self, target):
+        """Ban an IP address or range on the EBL through the API."""
+        response = self.client.post('/api/v1/targets/', {
+            'target': target,
+            'target_type': Target.IPADDR,
+            'target_action': Target.BAN,
+            'reason': 'test',
+            'method': EBL_METHOD,
+        })
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.content)['id']
+
+    def get_changes(self):
+        """Get the changes since the last call."""
+        data = json.loads(self.client.get(
+            '/ebl/ip/delta', {'since': self.cursor}).content)
+        self.cursor = data['cursor']
+        return [(item['change'], item['entry']) for item in data['changes']]
+
+    def test_entries_are_single_addresses(self):
+        self.ban('198.51.100.1')
+        self.assertEqual(self.get_changes(), [('add', '198.51.100.1')])
+        range_id = self.ban('198.51.100.0/30')
+        self.assertEqual(self.get_changes(), [
+            ('add', '198.51.100.0'),
+            ('add', '198.51.100.2'),
+            ('add', '198.51.100.3'),
+        ])
+        self.client.delete('/api/v1/targets/%s' % range_id)
+        self.assertEqual(self.get_changes(), [
+            ('remove', '198.51.100.0'),
+            ('remove', '198.51.100.2'),
+            ('remove', '198.51.100.3'),
+        ])
+        self.assertEqual(self.get_changes(), [])
+
+    def test_ranges_are_logged_once(self):
+        self.ban('198.51.100.1')
+        self.ban('198.51.0.0/16')
+        self.assertEqual(
+            list(EblChange.objects.order_by('id').values_list(
+                'entry', flat=True)), [
+                '198.51.100.1',
+                '198.51.0.0-198.51.100.0',
+                '198.51.100.2-198.51.255.255',
+            ])
+        self.assertEqual(len(self.get_changes()), views.DELTA_LIMIT)
+
+    def test_pages_continue_within_a_range(self):
+        original = views.DELTA_LIMIT
+        self.addCleanup(setattr, views, 'DELTA_LIMIT', original)
+        views.DELTA_LIMIT = 3
+        self.ban('198.51.100.0/30')
+        self.ban('198.51.100.9')
+        pages = []
+        more = True
+        while more:
+            data = json.loads(self.client.get(
+                '/ebl/ip/delta', {'since': self.cursor}).content)
+            self.cursor, more = data['cursor'], data['more']
+            pages.append(
+                [item['entry'].split('.')[-1] for item in data['changes']])
+        self.assertEqual(pages, [['0', '1', '2'], ['3', '9']])
+        self.assertEqual(self.get_changes(), [])
+
+    def test_applied_changes_match_the_list(self):
+        lines = set()
+        range_id = self.ban('198.51.100.4/30')
+        self.ban('198.51.100.6-198.51.100.9')
+        self.client.delete('/api/v1/targets/%s' % range_id)
+        for change, entry in self.get_changes():
+            if change == 'add':
+                lines.add(entry)
+            else:
+                lines.discard(entry)
+        write_snapshot(Target.IPADDR)
+        self.assertEqual(lines, set(self.get_lines(Target.IPADDR)))
+
+    def test_cursor_is_only_sent_with_the_plain_list(self):
+        self.ban('198.51.100.1')
+        self.assertEqual(self.client.get('/ebl/ip')['X-EBL-Cursor'], str(
+            EblChange.objects.get().id))
+        self.assertNotIn(
+            'X-EBL-Cursor', self.client.get('/ebl/ip', {'aggregate': 1}))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/ebl/ip/delta', {'since': 'x'})
+        self.assertEqual(response.status_code, 400)
@@ -7,4 +7,6 @@ app_name = 'ebl'
 urlpatterns = [
     url(r'^(?P<target_type>(ip|domain|url))$',
         views.target_list_ebl, name='ebl'),
+    url(r'^(?P<target_type>(ip|domain|url))/delta$',
+        views.target_list_ebl_delta, name='ebl_delta'),
 ]
@@ -1,26 +1,126 @@
 """EBL Django views."""
-from django.http import HttpResponse
-from django.views.decorators.http import require_http_methods
+from datetime import datetime
+import re
 
-from api.models import Target, TargetIpAddr
+from django.http import FileResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.timezone import utc
+from django.views.decorators.http import condition, require_http_methods
+
+from api.models import EblChange, Target
+from api.utils import int_to_ipaddr, ip_target_bounds
+from ebl.snapshots import IPADDR_AGGREGATE, get_snapshot, open_snapshot
+
+REGEX_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+DELTA_LIMIT = 10000
+
+
+def accepts_gzip(request):
+    """Check if the client accepts a gzip encoded response."""
+    return bool(REGEX_ACCEPTS_GZIP.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+def snapshot_name(request, target_type):
+    """Get the snapshot requested, aggregating IP addresses if asked to."""
+    if (target_type == Target.IPADDR and
+            request.GET.get('aggregate', '').lower() in ('1', 'true')):
+        return IPADDR_AGGREGATE
+    return target_type
+
+
+def snapshot_etag(meta, gzipped):
+    """Get the ETag of a snapshot, distinct for each encoding."""
+    return meta['version'] + ('-gzip' if gzipped else '')
+
+
+def ebl_etag(request, target_type):
+    """Get the ETag of the current EBL snapshot."""
+    return snapshot_etag(
+        get_snapshot(snapshot_name(request, target_type)),
+        accepts_gzip(request))
+
+
+def ebl_last_modified(request, target_type):
+    """Get the time the current EBL snapshot last changed."""
+    return datetime.fromtimestamp(
+        get_snapshot(snapshot_name(request, target_type))['last_modified'],
+        utc)
 
 
 @require_http_methods(['GET'])
+@condition(etag_func=ebl_etag, last_modified_func=ebl_last_modified)
 def target_list_ebl(request, target_type):
     """List all targets by type."""
     if request.method == 'GET':
-        ebl = ''
-        if target_type == Target.IPADDR:
-            ip_addrs = TargetIpAddr.objects.filter(
-                ipaddr_action=Target.BAN)
-            for ipa in ip_addrs:
-                if 'paloaltonetworks_add_to_ebl' in ipa.method:
-                    ebl += '%s\n' % ipa.ipaddr
+        name = snapshot_name(request, target_type)
+        gzipped = accepts_gzip(request)
+        snapshot, meta = open_snapshot(name, get_snapshot(name), gzipped)
+        response = FileResponse(snapshot, content_type='text/plain')
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # the snapshot may have been regenerated since the conditions
+        response['ETag'] = quote_etag(snapshot_etag(meta, gzipped))
+        response['Last-Modified'] = http_date(meta['last_modified'])
+        # the delta feed continues from this cursor, but its single
+        # addresses can't be applied to CIDR aggregates
+        if name != IPADDR_AGGREGATE:
+            response['X-EBL-Cursor'] = meta.get('cursor', 0)
+        return response
+
+
+def parse_delta_cursor(cursor):
+    """Get the last change and the entries read of the next from a cursor."""
+    after, _, skip = cursor.partition(':')
+    after, skip = int(after), int(skip or 0)
+    if after < 0 or skip < 0:
+        raise ValueError(cursor)
+    return after, skip
+
+
+def list_changes(target_type, after, skip):
+    """List up to DELTA_LIMIT entries changed after a cursor."""
+    # every change has at least one entry, so this is enough to fill a page
+    rows = list(EblChange.objects.filter(
+        target_type=target_type, id__gt=after).order_by('id').values_list(
+            'id', 'change', 'entry')[:DELTA_LIMIT + 1])
+    changes = []
+    for index, (change_id, change, entry) in enumerate(rows):
+        if target_type != Target.IPADDR:
+            changes.append({'change': change, 'entry': entry})
         else:
-            targets = Target.objects.filter(
-                target_action=Target.BAN,
-                target_type=target_type).distinct('target')
-            for tgt in targets:
-                if 'paloaltonetworks_add_to_ebl' in tgt.method:
-                    ebl += '%s\n' % tgt.target
-        return HttpResponse(ebl, content_type='text/plain')
+            # IP changes are logged as ranges, listed as single addresses
+            first, last = ip_target_bounds(entry)
+            first += skip
+            stop = min(last, first + DELTA_LIMIT - len(changes) - 1)
+            changes.extend(
+                {'change': change, 'entry': int_to_ipaddr(ipaddr)}
+                for ipaddr in xrange(first, stop + 1))
+            if stop < last:
+                # continue within this change on the next page
+                skip += stop - first + 1
+                return changes, '%s:%s' % (after, skip), True
+        after, skip = change_id, 0
+        if len(changes) == DELTA_LIMIT:
+            return changes, str(after), index + 1 < len(rows)
+    cursor = '%s:%s' % (after, skip) if skip else str(after)
+    return changes, cursor, False
+
+
+@require_http_methods(['GET'])
+def target_list_ebl_delta(request, target_type):
+    """List the entries added to or removed from an EBL since a cursor."""
+    if request.method == 'GET':
+        try:
+            after, skip = parse_delta_cursor(request.GET.get('since', '0'))
+        except ValueError:
+            return JsonResponse(
+                {'since': ['Invalid cursor.']}, status=400)
+        changes, cursor, more = list_changes(target_type, after, skip)
+        return JsonResponse({
+            'cursor': cursor,
+            'more': more,
+            'changes': changes,
+        })
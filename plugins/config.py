@@ -0,0 +1,52 @@
+"""Shared configuration of BanHammer plugins."""
+from ConfigParser import SafeConfigParser
+import os
+import threading
+
+# plugins.ini sits next to the plugins package, whatever the working
+# directory of the process is
+PLUGINS_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'plugins.ini')
+
+
+class PluginConfig(object):
+    """The sections of plugins.ini, parsed again only when it changes."""
+    def __init__(self, path):
+        self.path = path
+        self.stamp = None
+        self.sections = {}
+        self.lock = threading.Lock()
+
+    def get_stamp(self):
+        """Get the modification time and size of the file, if it exists."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def version(self):
+        """Reload the file if it changed and get the version in use."""
+        stamp = self.get_stamp()
+        if stamp != self.stamp:
+            with self.lock:
+                if stamp != self.stamp:
+                    config = SafeConfigParser()
+                    config.read(self.path)
+                    self.sections = dict(
+                        (section, dict(config.items(section)))
+                        for section in config.sections())
+                    self.stamp = stamp
+        return stamp
+
+    def section(self, name):
+        """Get a copy of the options of a section, or None if missing."""
+        self.version()
+        options = self.sections.get(name)
+        if options is None:
+            return None
+        return dict(options)
+
+
+CONFIG = PluginConfig(PLUGINS_CONFIG)
@@ -1,12 +1,23 @@
 """Define interfaces to Targets."""
-from ConfigParser import NoOptionError, NoSectionError, SafeConfigParser
+import hashlib
+import json
+import logging
 from operator import itemgetter
 import sys
 
 from rest_framework import serializers
 
+from plugins.config import CONFIG
 from plugins.exceptions import PluginError
 
+# get plugins logger
+LOGGER = logging.getLogger(__name__)
+
+TARGET_TYPES = ('ip', 'domain', 'url', 'hash', 'user')
+
+# catalogs of plugins and methods by Target type, built once per process
+CATALOGS = {}
+
 
 class InterfaceMeta(type):
     """An interface metaclass."""
@@ -65,22 +76,76 @@ def get_docstring(function):
     return docstring
 
 
-def get_method_weight(method):
-    """Get the configured method weight, otherwise set to 0."""
-    config = SafeConfigParser()
-    config.read('plugins.ini')
-    try:
-        # grab configuration options for method weights
-        weight = config.getint('plugin_method_weights', method)
-    except (NoOptionError, NoSectionError):
-        weight = 0
-    return weight
+def get_method_weights():
+    """Get the configured method weights."""
+    # grab configuration options for method weights
+    weights = CONFIG.section('plugin_method_weights') or {}
+    return dict(
+        (method, int(weight)) for method, weight in weights.iteritems())
+
+
+def build_catalog(target_type, version):
+    """Build the catalog of plugins and methods for a Target type."""
+    # import plugins before reading the registry of classes
+    __import__('plugins.%s_plugins' % target_type)
+    registry = getattr(sys.modules[__name__], target_type.title()).registry
+    weights = get_method_weights()
+    plugins = {}
+    for key, obj in registry.iteritems():
+        for mtd in dir(obj):
+            if callable(getattr(obj, mtd)) and not mtd.startswith('_'):
+                if key not in plugins:
+                    plugins[key] = []
+                plugins[key].append({
+                    'method': '%s_%s' % (key, mtd),
+                    'description': get_docstring(getattr(obj, mtd)),
+                    # methods without a configured weight are set to 0
+                    'weight': weights.get('%s_%s' % (key, mtd), 0),
+                })
+    methods = []
+    for dict_values in plugins.itervalues():
+        for value in dict_values:
+            methods.append(value)
+    methods_sorted_by_weight = sorted(
+        methods, key=itemgetter('weight'), reverse=True)
+    methods = [val['method'] for val in methods_sorted_by_weight]
+    return {
+        'plugins': plugins,
+        'methods': methods,
+        'method_set': frozenset(methods),
+        'etag': hashlib.sha1(json.dumps(plugins, sort_keys=True)).hexdigest(),
+        'version': version,
+    }
+
+
+def get_catalog(target_type):
+    """Get the catalog of a Target type, rebuilt if plugins.ini changed."""
+    version = CONFIG.version()
+    catalog = CATALOGS.get(target_type)
+    if catalog is None or catalog['version'] != version:
+        catalog = build_catalog(target_type, version)
+        CATALOGS[target_type] = catalog
+    return catalog
+
+
+def load_catalogs():
+    """Build the catalogs of all Target types."""
+    for target_type in TARGET_TYPES:
+        try:
+            get_catalog(target_type)
+        except Exception as err:
+            # a broken plugin or plugins.ini must not stop the app loading,
+            # so the catalog is built again on first use, raising the error
+            # to the caller
+            LOGGER.warning(
+                'Unable to load %s plugins: %s', target_type, err)
 
 
 class TargetInterface(object):
     """A class for getting and running plugin methods for a target."""
     def __init__(self, target, target_type, reason=None):
         self.target = target
+        self.target_type = target_type
         self.reason = reason
         # import plugins before creating interface to registry of classes
         __import__('plugins.%s_plugins' % target_type)
@@ -114,26 +179,13 @@ class TargetInterface(object):
     @property
     def plugins(self):
         """Get a dictionary of plugins and methods for this Target."""
-        plugins = {}
-        for key, obj in self.registry.iteritems():
-            for mtd in dir(obj):
-                if callable(getattr(obj, mtd)) and not mtd.startswith('_'):
-                    if key not in plugins:
-                        plugins[key] = []
-                    plugins[key].append({
-                        'method': '%s_%s' % (key, mtd),
-                        'description': get_docstring(getattr(obj, mtd)),
-                        'weight': get_method_weight('%s_%s' % (key, mtd)),
-                    })
-        return plugins
+        return get_catalog(self.target_type)['plugins']
 
     @property
     def methods(self):
         """Get a sorted (by weight) list of methods for this Target."""
-        methods = []
-        for dict_values in self.plugins.itervalues():
-            for value in dict_values:
-                methods.append(value)
-        methods_sorted_by_weight = sorted(
-            methods, key=itemgetter('weight'), reverse=True)
-        return [val['method'] for val in methods_sorted_by_weight]
+        return get_catalog(self.target_type)['methods']
+
+    def has_method(self, method):
+        """Check if a method exists for this Target."""
+        return method in get_catalog(self.target_type)['method_set']
@@ -0,0 +1,285 @@
+"""Plugin tests."""
+import copy
+import sys
+import threading
+import time
+
+from django.test import SimpleTestCase
+import ldap
+
+from plugins.exceptions import PluginError
+from plugins.user_plugins.activedirectory import ActiveDirectory, LdapPool
+from plugins.user_plugins.google import Google
+from plugins.utils import capture_stdout
+
+DISABLED_GROUP = 'CN=Disabled,OU=Groups,DC=example'
+DISABLED_OU = 'OU=Disabled,DC=example'
+
+
+class FakeLdap(object):
+    """A bound connection answering like python-ldap, without a server."""
+    def __init__(self, down=False, user=None):
+        self.conn = self
+        self.down = down
+        self.closed = False
+        # the one user object in the directory
+        self.user = user
+        self.pending = {}
+        self.searches = 0
+
+    def _apply(self, dn, modlist):
+        """Apply a modification to the user or one of its groups."""
+        for operation, attribute, values in modlist:
+            if attribute == 'userAccountControl':
+                self.user[attribute] = values
+            elif operation == ldap.MOD_ADD:
+                self.user.setdefault('memberOf', []).append(dn)
+            elif dn in self.user.get('memberOf', []):
+                self.user['memberOf'].remove(dn)
+                if not self.user['memberOf']:
+                    del self.user['memberOf']
+            else:
+                raise ldap.NO_SUCH_ATTRIBUTE({'desc': 'No such attribute'})
+
+    def modify(self, dn, modlist):
+        """Send a modification, returning its message id."""
+        msgid = len(self.pending) + 1
+        self.pending[msgid] = (dn, modlist)
+        return msgid
+
+    def result(self, msgid):
+        """Wait for the result of a modification."""
+        self._apply(*self.pending.pop(msgid))
+
+    def modify_s(self, dn, modlist):
+        """Modify and wait for the result."""
+        self._apply(dn, modlist)
+
+    def rename_s(self, dn, newrdn, newsuperior):
+        """Move the user to another organizational unit."""
+        self.user['distinguishedName'] = ['%s,%s' % (newrdn, newsuperior)]
+
+    def search_name(self, username):
+        """Get the user by its sAMAccountName."""
+        self.searches += 1
+        return [[('dn', copy.deepcopy(self.user))]]
+
+    def whoami_s(self):
+        """Check the bind, failing if the server dropped the connection."""
+        if self.down:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        return 'u:tester'
+
+    def close(self):
+        """Close the connection."""
+        self.closed = True
+
+
+class LdapPoolTests(SimpleTestCase):
+    """Pooled, bound connections to an LDAP server."""
+    def setUp(self):
+        self.pool = LdapPool(
+            'ldap.example.com', 'dc=example', 'admin', 'password', 2)
+        self.connections = []
+        self.down = False
+        self.pool._connect = self.connect
+
+    def connect(self):
+        """Open a fake connection."""
+        ldapl = FakeLdap(self.down)
+        self.connections.append(ldapl)
+        return ldapl
+
+    def test_connections_are_reused(self):
+        first = self.pool.run(lambda ldapl: ldapl)
+        self.assertIs(self.pool.run(lambda ldapl: ldapl), first)
+        self.assertEqual(len(self.connections), 1)
+
+    def test_dropped_connection_is_retried_on_a_fresh_bind(self):
+        dropped = self.pool.run(lambda ldapl: ldapl)
+        dropped.down = True
+        bound = self.pool.run(lambda ldapl: ldapl.whoami_s() and ldapl)
+        self.assertIsNot(bound, dropped)
+        self.assertTrue(dropped.closed)
+        self.assertEqual(self.pool.count, 1)
+
+    def test_server_down_fails_after_one_retry(self):
+        self.down = True
+        with self.assertRaises(ldap.SERVER_DOWN):
+            self.pool.run(lambda ldapl: ldapl.whoami_s())
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(self.pool.count, 0)
+
+    def test_other_errors_keep_the_connection(self):
+        def fail(ldapl):
+            raise PluginError('User "tester" does not exist.')
+        with self.assertRaises(PluginError):
+            self.pool.run(fail)
+        self.assertEqual(len(self.pool.idle), 1)
+        self.assertEqual(self.pool.count, 1)
+
+    def test_size_limits_open_connections(self):
+        held = [self.pool.acquire(), self.pool.acquire()]
+        acquired = threading.Event()
+
+        def acquire():
+            self.pool.release(self.pool.acquire())
+            acquired.set()
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.2))
+        self.pool.release(held[0])
+        thread.join()
+        self.assertTrue(acquired.is_set())
+        self.assertEqual(len(self.connections), 2)
+
+
+class ActiveDirectoryTests(SimpleTestCase):
+    """Batched modifications of Active Directory users."""
+    def setUp(self):
+        self.ldapl = FakeLdap(user={
+            'distinguishedName': ['CN=tester,OU=Users,DC=example'],
+            'sAMAccountName': ['tester'],
+            'cn': ['tester'],
+            'userAccountControl': ['512'],
+            'memberOf': ['CN=Staff,DC=example', 'CN=VPN,DC=example'],
+        })
+        pool = LdapPool(
+            'ldap.example.com', 'dc=example', 'admin', 'password', 1)
+        pool._connect = lambda: self.ldapl
+        # skip __init__, which reads plugins.ini
+        self.aduser = ActiveDirectory.__new__(ActiveDirectory)
+        self.aduser.pool = pool
+        self.aduser.aduser = copy.deepcopy(self.ldapl.user)
+        self.aduser.disabled_group = DISABLED_GROUP
+        self.aduser.disabled_ou = DISABLED_OU
+        self.aduser._backup_group_memberships = lambda: None
+
+    def test_lockdown_verifies_with_one_read(self):
+        self.aduser.lockdown()
+        self.assertEqual(self.ldapl.searches, 1)
+        self.assertEqual(self.ldapl.user['userAccountControl'], ['514'])
+        self.assertEqual(self.ldapl.user['memberOf'], [DISABLED_GROUP])
+        self.assertEqual(
+            self.ldapl.user['distinguishedName'],
+            ['cn=tester,%s' % DISABLED_OU])
+
+    def test_lockdown_keeps_the_disabled_group(self):
+        self.ldapl.user['memberOf'].append(DISABLED_GROUP)
+        self.aduser.aduser = copy.deepcopy(self.ldapl.user)
+        self.aduser.lockdown()
+        self.assertEqual(self.ldapl.user['memberOf'], [DISABLED_GROUP])
+
+    def test_failed_change_does_not_stop_the_others(self):
+        with self.assertRaises(ldap.NO_SUCH_ATTRIBUTE):
+            ActiveDirectory._modify_all(self.ldapl, [
+                ('CN=Other,DC=example', [(ldap.MOD_DELETE, 'member', [])]),
+                ('CN=VPN,DC=example', [(ldap.MOD_DELETE, 'member', [])]),
+            ])
+        self.assertEqual(
+            self.ldapl.user['memberOf'], ['CN=Staff,DC=example'])
+
+    def test_remove_group_memberships(self):
+        self.aduser.remove_group_memberships()
+        self.assertNotIn('memberOf', self.ldapl.user)
+        self.assertEqual(self.ldapl.searches, 1)
+
+
+class CaptureStdoutTests(SimpleTestCase):
+    """Output captured from plugins that print."""
+    def test_threads_capture_their_own_output(self):
+        stdout = sys.stdout
+        captured = {}
+
+        def capture(name):
+            with capture_stdout() as out:
+                sys.stdout.write(name)
+                time.sleep(0.05)
+                sys.stdout.write(name)
+            captured[name] = out[0]
+        threads = [
+            threading.Thread(target=capture, args=(name,))
+            for name in 'abcd']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            captured, {'a': 'aa', 'b': 'bb', 'c': 'cc', 'd': 'dd'})
+        self.assertIs(sys.stdout, stdout)
+
+
+class FakeGam(object):
+    """GAM's command processor, for one user, without the Google API."""
+    def __init__(self):
+        self.commands = []
+        self.groups = ['staff@example.com', 'vpn@example.com']
+        self.returncode = 0
+
+    def __call__(self, args):
+        self.commands.append(' '.join(args[1:4]))
+        if args[1] == 'info':
+            sys.stdout.write('User: %s@example.com\n' % args[3])
+            # GAM prints as it goes, giving other threads a chance to run
+            time.sleep(0.01)
+            sys.stdout.write('Groups: (%s)\n' % len(self.groups))
+            for group in self.groups:
+                sys.stdout.write('   %s <%s>\n' % (group.split('@')[0], group))
+        elif args[1] == 'user' and args[3:] == ['delete', 'groups']:
+            if self.returncode:
+                sys.stderr.write('ERROR: 503: Backend Error\n')
+                return self.returncode
+            del self.groups[:]
+        return 0
+
+
+class GoogleTests(SimpleTestCase):
+    """Google user actions run through GAM."""
+    def setUp(self):
+        # skip __init__, which reads plugins.ini and imports GAM
+        self.google = Google.__new__(Google)
+        self.google.username = 'tester'
+        self.google.domain = 'example.com'
+        self.google._info = None
+        self.google._backup_group_memberships = lambda: self.google.groups
+        self.gam = self.google.gam = FakeGam()
+
+    def test_info_is_read_once_until_an_update(self):
+        self.assertEqual(
+            self.google.groups, ['staff@example.com', 'vpn@example.com'])
+        self.assertEqual(len(self.google.groups), 2)
+        self.assertEqual(self.gam.commands, ['info user tester'])
+
+    def test_groups_are_removed_with_one_command(self):
+        self.google.remove_group_memberships()
+        self.assertEqual(self.gam.commands, [
+            'info user tester', 'user tester delete', 'info user tester'])
+        self.assertEqual(self.gam.groups, [])
+
+    def test_workers_read_their_own_user(self):
+        users = {}
+
+        def read_groups(username, groups):
+            google = Google.__new__(Google)
+            google.username = username
+            google._info = None
+            google.gam = FakeGam()
+            google.gam.groups = groups
+            users[username] = google.groups
+        threads = [
+            threading.Thread(target=read_groups, args=(
+                'user%s' % number, ['group%s@example.com' % number]))
+            for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(users, dict(
+            ('user%s' % number, ['group%s@example.com' % number])
+            for number in range(4)))
+
+    def test_failed_removal_reports_the_gam_error(self):
+        self.gam.returncode = 1
+        with self.assertRaises(PluginError) as context:
+            self.google.remove_group_memberships()
+        self.assertIn('503: Backend Error', context.exception.message)
@@ -1,5 +1,7 @@
 """Define all Active Directory actions."""
 from datetime import datetime
+import threading
+import time
 
 import ldap
 from pyldaplite import PyLDAPLite
@@ -9,20 +11,161 @@ from plugins.interfaces import User
 from plugins.utils import generate_random_string, get_plugin_config_options
 
 
-class ActiveDirectory(User):
-    """Active Directory user object for performing LDAP commands."""
-    def __init__(self, username, reason):
-        # create LDAP connection
-        self._setup_plugins_config()
-        self.ldapl = PyLDAPLite(
+# bound connections kept open to the directory, unless configured
+POOL_SIZE = 4
+# seconds an idle connection is trusted before being checked again
+POOL_CHECK_INTERVAL = 60
+
+
+class LdapPool(object):
+    """Process-wide pool of bound connections to an LDAP server."""
+    def __init__(self, server, base_dn, admin, password, size):
+        self.server = server
+        self.base_dn = base_dn
+        self.admin = admin
+        self.password = password
+        self.size = size
+        # (connection, time last used) pairs ready to be handed out
+        self.idle = []
+        # connections open, whether idle or in use
+        self.count = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def _connect(self):
+        """Open a connection and bind to the server."""
+        ldapl = PyLDAPLite(
             server='ldaps://%s' % self.server, base_dn=self.base_dn)
         try:
-            self.ldapl.connect(self.admin, self.password)
+            ldapl.connect(self.admin, self.password)
         except ldap.LDAPError as err:
             raise PluginError(
                 'LDAP error while creating connection: %s' %
-                self._get_ldap_errors(err))
-        self.aduser = self._get(username)
+                ActiveDirectory._get_ldap_errors(err))
+        return ldapl
+
+    @staticmethod
+    def _is_healthy(ldapl):
+        """Check that a connection is still bound to the server."""
+        try:
+            ldapl.conn.whoami_s()
+        except ldap.LDAPError:
+            return False
+        return True
+
+    @staticmethod
+    def _close(ldapl):
+        """Close a connection, ignoring errors from dead connections."""
+        try:
+            ldapl.close()
+        except ldap.LDAPError:
+            pass
+
+    def acquire(self, check=False):
+        """Get a bound connection, waiting if the pool is at its size."""
+        with self.cond:
+            while not self.idle and self.count >= self.size:
+                self.cond.wait()
+            if self.idle:
+                ldapl, last_used = self.idle.pop()
+            else:
+                ldapl, last_used = None, None
+                self.count += 1
+        try:
+            if (ldapl is not None and
+                    (check or
+                     time.time() - last_used > POOL_CHECK_INTERVAL) and
+                    not self._is_healthy(ldapl)):
+                # the server dropped the connection, so rebind
+                self._close(ldapl)
+                ldapl = None
+            if ldapl is None:
+                ldapl = self._connect()
+        except Exception:
+            self._discard(None)
+            raise
+        return ldapl
+
+    def release(self, ldapl):
+        """Return a connection to the pool."""
+        with self.cond:
+            if self.closed:
+                self.count -= 1
+                self._close(ldapl)
+            else:
+                self.idle.append((ldapl, time.time()))
+            self.cond.notify()
+
+    def _discard(self, ldapl):
+        """Close a connection instead of returning it to the pool."""
+        if ldapl is not None:
+            self._close(ldapl)
+        with self.cond:
+            self.count -= 1
+            self.cond.notify()
+
+    def run(self, operation):
+        """Call operation with a bound connection and return its result."""
+        # a connection dropped by the server fails the operation, so the
+        # operation is run once more on a connection known to be bound
+        for retry in (False, True):
+            ldapl = self.acquire(check=retry)
+            try:
+                result = operation(ldapl)
+            except ldap.SERVER_DOWN:
+                self._discard(ldapl)
+                if retry:
+                    raise
+                continue
+            except Exception:
+                # the error may have come from a dead connection
+                if self._is_healthy(ldapl):
+                    self.release(ldapl)
+                else:
+                    self._discard(ldapl)
+                raise
+            self.release(ldapl)
+            return result
+
+    def close(self):
+        """Close idle connections, and the others once released."""
+        with self.cond:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.count -= len(idle)
+        for ldapl, _ in idle:
+            self._close(ldapl)
+
+
+# the pool for the current plugins.ini settings
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+def get_pool(server, base_dn, admin, password, size):
+    """Get the connection pool for a directory and its credentials."""
+    key = (server, base_dn, admin, password, size)
+    with POOLS_LOCK:
+        pool = POOLS.get(key)
+        if pool is None:
+            # plugins.ini changed, so stop using connections to the old one
+            for stale in POOLS.values():
+                stale.close()
+            POOLS.clear()
+            pool = POOLS[key] = LdapPool(*key)
+    return pool
+
+
+class ActiveDirectory(User):
+    """Active Directory user object for performing LDAP commands."""
+    def __init__(self, username, reason):
+        # get pooled LDAP connections
+        self._setup_plugins_config()
+        self.pool = get_pool(
+            self.server, self.base_dn, self.admin, self.password,
+            self.pool_size)
+        self.aduser = self.pool.run(
+            lambda ldapl: self._get(ldapl, username))
         self.reason = reason
 
     def _setup_plugins_config(self):
@@ -37,6 +180,7 @@ class ActiveDirectory(User):
             self.backup_dir = option['backup_dir']
             self.disabled_group = option['disabled_group']
             self.disabled_ou = option['disabled_ou']
+            self.pool_size = int(option.get('pool_size', POOL_SIZE))
         except KeyError as err:
             raise PluginError('No "%s" option in plugins.ini' % err.message)
 
@@ -50,10 +194,12 @@ class ActiveDirectory(User):
             errors.append(err.args[0]['desc'])
         return ' '.join(errors)
 
-    def _get(self, username):
+    def _get(self, ldapl, username):
         """Get one or more Active Directory user objects."""
         try:
-            result = self.ldapl.search_name(username)
+            result = ldapl.search_name(username)
+        except ldap.SERVER_DOWN:
+            raise
         except ldap.LDAPError:
             raise PluginError('LDAP error - Invalid Base DN')
 
@@ -65,14 +211,49 @@ class ActiveDirectory(User):
         elif len(result) == 1:
             return result[0][0][1]
 
+    @staticmethod
+    def _modify_all(ldapl, changes):
+        """Send (dn, modlist) changes at once, then wait for every result."""
+        # pipelined changes take one round trip instead of one each
+        msgids = [ldapl.conn.modify(dn, modlist) for dn, modlist in changes]
+        error = None
+        for msgid in msgids:
+            try:
+                ldapl.conn.result(msgid)
+            except ldap.LDAPError as err:
+                error = error or err
+        if error is not None:
+            raise error
+
+    def _disable_change(self):
+        """Get the change setting the disabled flag of the user."""
+        new_uac = str(int(self.aduser['userAccountControl'][0]) | 0x00000002)
+        return (
+            self.aduser['distinguishedName'][0],
+            [(ldap.MOD_REPLACE, 'userAccountControl', [new_uac])])
+
+    def _group_change(self, group_dn, operation):
+        """Get the change adding the user to or removing it from a group."""
+        return (
+            group_dn,
+            [(operation, 'member', self.aduser['distinguishedName'])])
+
+    def _is_disabled(self):
+        """Check if the user is disabled."""
+        return bool(int(self.aduser['userAccountControl'][0]) & 0x00000002)
+
+    def _superior(self):
+        """Get the distinguishedName of the OU holding the user."""
+        return self.aduser['distinguishedName'][0].split(',', 1)[1]
+
     def randomize_password(self):
         """Change an Active Directory user's password to a random value."""
         new_pwd = generate_random_string(self.reset_password_length)
         new_pwd = unicode('\"' + new_pwd + '\"').encode('utf-16-le')
         try:
-            self.ldapl.conn.modify_s(
+            self.pool.run(lambda ldapl: ldapl.conn.modify_s(
                 self.aduser['distinguishedName'][0],
-                [(ldap.MOD_REPLACE, 'unicodePwd', [new_pwd])])
+                [(ldap.MOD_REPLACE, 'unicodePwd', [new_pwd])]))
         except ldap.LDAPError as err:
             raise PluginError(
                 'LDAP error while randomizing AD password: %s' %
@@ -98,39 +279,40 @@ class ActiveDirectory(User):
         if 'memberOf' not in self.aduser:
             return
         self._backup_group_memberships()
+
+        def remove_groups(ldapl):
+            """Remove the user from its groups and get it again."""
+            self._modify_all(ldapl, [
+                self._group_change(group, ldap.MOD_DELETE)
+                for group in self.aduser['memberOf']
+            ])
+            return self._get(ldapl, self.aduser['sAMAccountName'][0])
         try:
-            for group in self.aduser['memberOf']:
-                self.ldapl.conn.modify_s(
-                    group,
-                    [(
-                        ldap.MOD_DELETE,
-                        'member',
-                        self.aduser['distinguishedName'])])
-            self.aduser = self._get(self.aduser['sAMAccountName'][0])
-            if 'memberOf' in self.aduser:
-                raise PluginError(
-                    'Removing group memberships - Verification failed.')
+            self.aduser = self.pool.run(remove_groups)
         except ldap.LDAPError as err:
             raise PluginError(
                 'LDAP error while removing from groups: %s' %
                 self._get_ldap_errors(err))
+        if 'memberOf' in self.aduser:
+            raise PluginError(
+                'Removing group memberships - Verification failed.')
 
     def _add_group(self, group_dn):
         """Add a user object to an Active Directory group."""
+        def add_group(ldapl):
+            """Add the user to the group and get it again."""
+            ldapl.conn.modify_s(*self._group_change(group_dn, ldap.MOD_ADD))
+            return self._get(ldapl, self.aduser['sAMAccountName'][0])
         try:
-            self.ldapl.conn.modify_s(
-                group_dn,  # distinguishedName
-                [(ldap.MOD_ADD, 'member', self.aduser['distinguishedName'])]
-            )
-            self.aduser = self._get(self.aduser['sAMAccountName'][0])
-            if ('memberOf' not in self.aduser or
-                    group_dn not in self.aduser['memberOf']):
-                raise PluginError(
-                    'Adding to group "%s" - Verification failed.' % group_dn)
+            self.aduser = self.pool.run(add_group)
         except ldap.LDAPError as err:
             raise PluginError(
                 'LDAP error while adding user to group: %s' %
                 self._get_ldap_errors(err))
+        if ('memberOf' not in self.aduser or
+                group_dn not in self.aduser['memberOf']):
+            raise PluginError(
+                'Adding to group "%s" - Verification failed.' % group_dn)
 
     def add_to_disabled_group(self):
         """Add an Active Directory user to the configured disabled group."""
@@ -138,38 +320,83 @@ class ActiveDirectory(User):
 
     def disable(self):
         """Disables an Active Directory user account."""
-        new_uac = str(int(self.aduser['userAccountControl'][0]) | 0x00000002)
+        def disable_user(ldapl):
+            """Disable the user and get it again."""
+            ldapl.conn.modify_s(*self._disable_change())
+            return self._get(ldapl, self.aduser['sAMAccountName'][0])
         try:
-            self.ldapl.conn.modify_s(
-                self.aduser['distinguishedName'][0],
-                [(ldap.MOD_REPLACE, 'userAccountControl', [new_uac])])
-            self.aduser = self._get(self.aduser['sAMAccountName'][0])
-            if not int(self.aduser['userAccountControl'][0]) & 0x00000002:
-                raise PluginError(
-                    'Disabling account - Verification failed.')
+            self.aduser = self.pool.run(disable_user)
         except ldap.LDAPError as err:
             raise PluginError(
                 'LDAP error while disabling AD account: %s' %
                 self._get_ldap_errors(err))
+        if not self._is_disabled():
+            raise PluginError('Disabling account - Verification failed.')
 
     def _move(self, newsuperior):
         """Move an Active Directory user to another organizational unit."""
-        try:
-            self.ldapl.conn.rename_s(
+        def move_user(ldapl):
+            """Move the user and get it again."""
+            ldapl.conn.rename_s(
                 self.aduser['distinguishedName'][0],
                 'cn=%s' % self.aduser['cn'][0],
                 newsuperior)
-            self.aduser = self._get(self.aduser['sAMAccountName'][0])
-            superior = self.aduser['distinguishedName'][0].split(
-                ',', 1)[1]
-            if newsuperior.lower() != superior.lower():
-                raise PluginError(
-                    'Moving to "%s" - Verification failed.' % newsuperior)
+            return self._get(ldapl, self.aduser['sAMAccountName'][0])
+        try:
+            self.aduser = self.pool.run(move_user)
         except ldap.LDAPError as err:
             raise PluginError(
                 'LDAP error while moving AD object: %s' %
                 self._get_ldap_errors(err))
+        if newsuperior.lower() != self._superior().lower():
+            raise PluginError(
+                'Moving to "%s" - Verification failed.' % newsuperior)
 
     def move_to_disabled_ou(self):
         """Move an Active Directory user to the configured disabled OU."""
         self._move(self.disabled_ou)
+
+    def lockdown(self):
+        """Disable, move to disabled OU and keep only the disabled group."""
+        self._backup_group_memberships()
+        groups = [
+            group for group in self.aduser.get('memberOf', [])
+            if group.lower() != self.disabled_group.lower()
+        ]
+        changes = [self._disable_change()]
+        changes.extend(
+            self._group_change(group, ldap.MOD_DELETE) for group in groups)
+        if len(groups) == len(self.aduser.get('memberOf', [])):
+            changes.append(
+                self._group_change(self.disabled_group, ldap.MOD_ADD))
+
+        def lockdown_user(ldapl):
+            """Send the changes, move the user and get it again."""
+            self._modify_all(ldapl, changes)
+            # the group changes name the user by its current
+            # distinguishedName, so move it once they are done
+            if self._superior().lower() != self.disabled_ou.lower():
+                ldapl.conn.rename_s(
+                    self.aduser['distinguishedName'][0],
+                    'cn=%s' % self.aduser['cn'][0],
+                    self.disabled_ou)
+            # verify every change with one read
+            return self._get(ldapl, self.aduser['sAMAccountName'][0])
+        try:
+            self.aduser = self.pool.run(lockdown_user)
+        except ldap.LDAPError as err:
+            raise PluginError(
+                'LDAP error while locking down AD account: %s' %
+                self._get_ldap_errors(err))
+        failed = []
+        if not self._is_disabled():
+            failed.append('disabling account')
+        if [group.lower() for group in self.aduser.get('memberOf', [])] != [
+                self.disabled_group.lower()]:
+            failed.append('replacing groups with "%s"' % self.disabled_group)
+        if self._superior().lower() != self.disabled_ou.lower():
+            failed.append('moving to "%s"' % self.disabled_ou)
+        if failed:
+            raise PluginError(
+                'Locking down account - Verification failed: %s.' %
+                ', '.join(failed))
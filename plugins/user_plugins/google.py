@@ -13,6 +13,8 @@ class Google(User):
         self._setup_plugins_config()
         self.username = username
         self.reason = reason
+        # parsed output of "gam info user", until the next update
+        self._info = None
         # Load GAM
         try:
             import sys
@@ -37,26 +39,37 @@ class Google(User):
 
     def _run_gam(self, gam_cmd):
         """Take a GAM command string and run it."""
+        # GAM keeps module state too, so it runs under the capture lock
         with capture_stdout() as out:
-            self.gam(gam_cmd.split())
+            retcode = self.gam(gam_cmd.split())
         if out[1]:
             if '403' in out[1]:
                 raise PluginError(
                     'GAM error - Not authorized to access this resource/API.')
+        out.append(retcode)
         return out
 
     @property
     def info(self):
         """Get Google user account information."""
-        out = self._run_gam('gam info user %s' % self.username)[0]
-        if not out:
-            raise PluginError('GAM error - User could not be found.')
-        return out
+        if self._info is None:
+            out = self._run_gam('gam info user %s' % self.username)[0]
+            if not out:
+                raise PluginError('GAM error - User could not be found.')
+            self._info = out
+        return self._info
+
+    def _invalidate_info(self):
+        """Forget user account information changed by an update."""
+        self._info = None
 
     def _update(self, arguments):
         """Update a Google user."""
-        return self._run_gam(
-            'gam update user %s %s' % (self.username, arguments))[0]
+        try:
+            return self._run_gam(
+                'gam update user %s %s' % (self.username, arguments))[0]
+        finally:
+            self._invalidate_info()
 
     def randomize_password(self):
         """Changes a Google user's password to a random value."""
@@ -68,13 +81,17 @@ class Google(User):
             raise PluginError(
                 'Randomizing password - Verification failed.')
 
-    def _remove_group(self, group):
-        """Remove Google user from group."""
-        out = self._run_gam('gam update group %s remove user %s' % (
-            group, self.username))[1]
-        if out != ' removing %s@%s\n' % (self.username, self.domain):
+    def _remove_groups(self):
+        """Remove Google user from all groups with one GAM command."""
+        try:
+            out = self._run_gam(
+                'gam user %s delete groups' % self.username)
+        finally:
+            self._invalidate_info()
+        if out[2]:
             raise PluginError(
-                'Removing user from group - Verification failed.')
+                'Removing group memberships - GAM returned %s: %s' % (
+                    out[2], out[1].strip()))
 
     @property
     def groups(self):
@@ -113,8 +130,11 @@ class Google(User):
         self._backup_group_memberships()
         groups = self.groups
         if groups:
-            for grp in groups:
-                self._remove_group(grp)
+            self._remove_groups()
+            # verify every removal with one read
+            if self.groups:
+                raise PluginError(
+                    'Removing group memberships - Verification failed.')
 
     def remove_from_gal(self):
         """Remove a Google user from the Global Address List."""
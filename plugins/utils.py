@@ -1,11 +1,15 @@
 """Miscellaneous utility functions shared by BanHammer plugins."""
-from ConfigParser import NoSectionError, SafeConfigParser
 import contextlib
 import random
 import string
+import threading
 
+from plugins.config import CONFIG
 from plugins.exceptions import PluginError
 
+# sys.stdout and sys.stderr are process-wide, so only one thread may swap them
+CAPTURE_LOCK = threading.RLock()
+
 
 def generate_random_string(length):
     """Generate a random string."""
@@ -16,12 +20,10 @@ def generate_random_string(length):
 
 def get_plugin_config_options(section):
     """Get configuration options from plugins.ini."""
-    config = SafeConfigParser()
-    config.read('plugins.ini')
-    try:
-        return dict(config.items(section))
-    except NoSectionError:
+    options = CONFIG.section(section)
+    if options is None:
         raise PluginError('No "%s" section in plugins.ini' % section)
+    return options
 
 
 def convert_str_tolist(astring):
@@ -31,15 +33,16 @@ def convert_str_tolist(astring):
 
 @contextlib.contextmanager
 def capture_stdout():
-    """Capture stdout from Python script."""
+    """Capture stdout from Python script, one thread at a time."""
     import sys
     from cStringIO import StringIO
-    oldout, olderr = sys.stdout, sys.stderr
-    try:
-        stdout = [StringIO(), StringIO()]
-        sys.stdout, sys.stderr = stdout
-        yield stdout
-    finally:
-        sys.stdout, sys.stderr = oldout, olderr
-        stdout[0] = stdout[0].getvalue()
-        stdout[1] = stdout[1].getvalue()
+    with CAPTURE_LOCK:
+        oldout, olderr = sys.stdout, sys.stderr
+        try:
+            stdout = [StringIO(), StringIO()]
+            sys.stdout, sys.stderr = stdout
+            yield stdout
+        finally:
+            sys.stdout, sys.stderr = oldout, olderr
+            stdout[0] = stdout[0].getvalue()
+            stdout[1] = stdout[1].getvalue()